@@ -1,13 +1,17 @@
 import streamlit as st
 
+from utils.image_assets import thumbnail
+
+COVER_WIDTH = 1400  # Wide enough for the page at HiDPI
+
 # Add a title to the page
 st.title("Welcome to My Streamlit App")
 
 # Add a header
 st.header("An Amazing Streamlit Experience")
 
-# Add a cover image
-st.image("pages/gojo.jpg", use_column_width=True)
+# Add a cover image (resized WebP, decoded once per server process)
+st.image(thumbnail("pages/gojo.jpg", width=COVER_WIDTH), use_column_width=True)
 
 # Add some introductory text
 st.markdown("""
@@ -0,0 +1,2 @@
+# Offline load tests for the chat pipeline (fake Gemini and BigQuery);
+# run with python -m benchmarks.run_benchmark
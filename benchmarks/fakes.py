@@ -0,0 +1,230 @@
+# Offline stand-ins for Gemini and BigQuery
+#
+# ScriptedModel answers like genai.GenerativeModel: generate_content(prompt)
+# returns an object with .text and .usage_metadata, and stream=True yields
+# chunks. Replies are chosen by matching the prompt against a script, and
+# latency (time to first token plus per-chunk delay) is configurable.
+# FakeBigQueryClient runs the SQL on DuckDB over a synthetic
+# transaction_summary_with_sales table. It implements the parts of the client
+# the utils use: query() with dry runs, job.result() / cancel(),
+# total_bytes_processed, RowIterator.to_arrow(), list_rows() and get_table().
+
+import itertools
+import re
+import threading
+import time
+from collections import namedtuple
+
+import duckdb
+import numpy as np
+import pandas as pd
+from google.api_core.exceptions import BadRequest
+
+from utils.schema_catalog import DEFAULT_COLUMNS, TABLE_ID
+
+TABLE_NAME = TABLE_ID.rsplit(".", 1)[-1]
+
+Usage = namedtuple("Usage", ["prompt_token_count", "candidates_token_count"])
+SchemaField = namedtuple("SchemaField", ["name", "field_type", "description"])
+FakeTable = namedtuple("FakeTable", ["schema", "num_rows"])
+
+# The questions from the test notes at the bottom of Chat BotV3.py, with the SQL a
+# well-behaved model would write for them (None means general conversation)
+QUESTIONS = {
+    "good morning": None,
+    "i have a pen": None,
+    "i want to know unique Product Id": f"SELECT DISTINCT ProductId FROM `{TABLE_ID}`",
+    "i want to know sale person name and sale person average round trip hours top 10": (
+        f"SELECT SalesPersonName, AVG(SalesPersonAvgRoundTripHours) AS avg_hours FROM `{TABLE_ID}` "
+        f"GROUP BY SalesPersonName ORDER BY avg_hours DESC LIMIT 10"),
+    "i want to know unique Customer Name by each province": (
+        f"SELECT CustomerCountry, COUNT(DISTINCT CustomerName) AS customers FROM `{TABLE_ID}` "
+        f"GROUP BY CustomerCountry"),
+    "i want to know product lens type and Quantity of each lens type": (
+        f"SELECT ProductLensType, SUM(Quantity) AS Quantity FROM `{TABLE_ID}` GROUP BY ProductLensType"),
+    "thank you": None,
+}
+
+_QUOTED_INPUT = re.compile(r"user's input: '(.*)'", re.S)
+_CHAT_INPUT = re.compile(r'User input: "(.*)"', re.S)
+
+
+class FakeResponse:
+    def __init__(self, text, usage=None):
+        self.text = text
+        self.usage_metadata = usage
+
+
+class ScriptedModel:
+    """Drop-in for genai.GenerativeModel. `script` is a list of (substring, reply)
+    pairs checked in order; a reply may be a callable taking the prompt."""
+
+    def __init__(self, script=None, model_name="scripted", first_token_seconds=0.3,
+                 chunk_seconds=0.02, chunk_chars=24):
+        self.script = script if script is not None else default_script()
+        self.model_name = model_name
+        self.first_token_seconds = first_token_seconds
+        self.chunk_seconds = chunk_seconds
+        self.chunk_chars = chunk_chars
+        self.calls = itertools.count()
+
+    def reply(self, prompt):
+        next(self.calls)
+        for needle, reply in self.script:
+            if needle in prompt:
+                return reply(prompt) if callable(reply) else reply
+        return "I'm not sure how to help with that."
+
+    def generate_content(self, prompt, stream=False):
+        text = self.reply(prompt)
+        usage = Usage(len(prompt) // 4, len(text) // 4)
+        if stream:
+            return self._stream(text, usage)
+        chunks = max(1, len(text) // self.chunk_chars)
+        time.sleep(self.first_token_seconds + self.chunk_seconds * (chunks - 1))
+        return FakeResponse(text, usage)
+
+    def _stream(self, text, usage):
+        time.sleep(self.first_token_seconds)
+        pieces = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)] or [""]
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(self.chunk_seconds)
+            yield FakeResponse(piece, usage if i == len(pieces) - 1 else None)
+
+
+def _question_sql(prompt):
+    match = _QUOTED_INPUT.search(prompt)
+    question = match.group(1) if match else ""
+    return QUESTIONS.get(question) or f"SELECT * FROM `{TABLE_ID}` LIMIT 10"
+
+
+def _category(prompt):
+    match = _CHAT_INPUT.search(prompt)
+    question = match.group(1) if match else ""
+    return "02" if QUESTIONS.get(question, "") is None else "01"
+
+
+def default_script(plot_code=False):
+    """Replies for the chat agents' prompts. With `plot_code`, the chart spec reply
+    is unusable, so Agent 05 falls back to writing plot code."""
+    return [
+        ("Categorize the following user input", _category),
+        ("transforms user questions into SQL", _question_sql),
+        ("Pick a plotly express chart", "A bar chart would work." if plot_code else '{"kind": null}'),
+        ("Generate Python code", "fig = px.bar(df, x=df.columns[0], y=df.columns[-1])"),
+        ("create a friendly answer", "Here is what the data shows: the top rows are listed above, "
+                                     "and the totals are spread fairly evenly across the groups."),
+        ("friendly conversational style", "Hello! I'm happy to help you explore the sales data."),
+        ("Greet the user", "Hi, I'm your data assistant. Ask me anything about the sales table."),
+    ]
+
+
+def synthetic_transactions(rows, seed=0):
+    """DataFrame with the columns of transaction_summary_with_sales and `rows` rows."""
+    rng = np.random.default_rng(seed)
+
+    def pick(prefix, distinct):
+        return pd.Series(rng.integers(0, distinct, rows)).map(lambda i: f"{prefix}{i:04d}")
+
+    return pd.DataFrame({
+        "ProductId": pick("P", 500),
+        "InvoiceNo": pd.Series(np.arange(rows) // 3).map(lambda i: f"INV{i:07d}"),
+        "Return_item_cause_id": pick("R", 8),
+        "Quantity": rng.integers(1, 20, rows),
+        "CustomerID": pick("C", 2000),
+        "InvoiceDate": pd.Timestamp("2022-01-01") + pd.to_timedelta(rng.integers(0, 3 * 365, rows), unit="D"),
+        "CustomerName": pick("Customer ", 2000),
+        "CustomerCountry": pick("Province ", 77),
+        "CustomerCategory": rng.choice(["Retail", "Wholesale", "Online", "Clinic"], rows),
+        "ProductDescription": pick("Product ", 500),
+        "ProductMaterialType": rng.choice(["Glass", "Plastic", "Polycarbonate"], rows),
+        "ProductLensType": rng.choice(["Single Vision", "Bifocal", "Progressive", "Photochromic"], rows),
+        "ProductPrice": rng.gamma(2.0, 800.0, rows).round(2),
+        "Return_item_cause": rng.choice(["Damaged", "Wrong item", "Changed mind", "None"], rows),
+        "SalesPersonName": pick("Sales ", 40),
+        "SalesPersonAvgRoundTripHours": rng.uniform(0.5, 12.0, rows).round(1),
+    })
+
+
+class FakeRowIterator:
+    def __init__(self, table):
+        self._table = table
+        self.total_rows = table.num_rows
+
+    def to_arrow(self, create_bqstorage_client=False):
+        return self._table
+
+
+class FakeQueryJob:
+    _ids = itertools.count(1)
+
+    def __init__(self, backend, sql, latency):
+        self.job_id = f"fake-job-{next(self._ids)}"
+        self._backend = backend
+        self._sql = sql
+        self._latency = latency
+        self.total_bytes_processed = backend.estimate_bytes(sql)
+        self.cancelled = False
+
+    def result(self, timeout=None):
+        time.sleep(self._latency)
+        return FakeRowIterator(self._backend.execute(self._sql))
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeBigQueryClient:
+    """In-process BigQuery over DuckDB. `job_latency` is added to every real
+    (non dry-run) job to stand in for queueing and slot time."""
+
+    def __init__(self, rows=100_000, project="madt-finalproject", job_latency=0.5, seed=0):
+        self.project = project
+        self.job_latency = job_latency
+        df = synthetic_transactions(rows, seed)
+        self.num_rows = len(df)
+        self._bytes_per_column = {name: int(df[name].memory_usage(deep=True)) for name in df.columns}
+        self._lock = threading.Lock()   # One DuckDB database; each query gets its own cursor
+        self._conn = duckdb.connect()
+        self._conn.register("synthetic", df)
+        self._conn.execute(f"CREATE TABLE {TABLE_NAME} AS SELECT * FROM synthetic")
+        self._conn.unregister("synthetic")
+
+    def translate(self, sql):
+        # `project.dataset.table` -> table; other backticks become DuckDB quotes
+        sql = re.sub(r"`[^`]*\." + TABLE_NAME + "`", TABLE_NAME, sql)
+        return sql.replace("`", '"')
+
+    def estimate_bytes(self, sql):
+        # BigQuery bills the columns a query touches, so the estimate follows the same idea
+        if re.search(r"select\s+\*", sql, re.IGNORECASE):
+            return sum(self._bytes_per_column.values())
+        return sum(size for name, size in self._bytes_per_column.items() if re.search(rf"\b{name}\b", sql))
+
+    def execute(self, sql):
+        try:
+            with self._lock:
+                cursor = self._conn.cursor()
+            return cursor.execute(self.translate(sql)).fetch_arrow_table()
+        except duckdb.Error as e:
+            raise BadRequest(str(e))
+
+    def query(self, sql, job_config=None):
+        if job_config is not None and getattr(job_config, "dry_run", False):
+            try:
+                with self._lock:
+                    cursor = self._conn.cursor()
+                cursor.execute(f"EXPLAIN {self.translate(sql)}")
+            except duckdb.Error as e:
+                raise BadRequest(str(e))
+        return FakeQueryJob(self, sql, self.job_latency)
+
+    def list_rows(self, table_id):
+        return FakeRowIterator(self.execute(f"SELECT * FROM {TABLE_NAME}"))
+
+    def get_table(self, table_id):
+        types = {column.name: column.data_type for column in DEFAULT_COLUMNS}
+        descriptions = {column.name: column.description for column in DEFAULT_COLUMNS}
+        schema = [SchemaField(name, types.get(name, "STRING"), descriptions.get(name, "")) for name in self._bytes_per_column]
+        return FakeTable(schema, self.num_rows)
@@ -0,0 +1,135 @@
+# Headless load test of the chat turn pipeline
+#
+# Runs the chat turn of the pages (utils.chat_agents.chat_turn: router -> SQL ->
+# guarded BigQuery job -> answer -> chart, on the background turn engine)
+# against ScriptedModel and FakeBigQueryClient. Every simulated session asks
+# the test questions one after another, the way a user would. Each concurrency level reports
+# throughput, turn latency, per-stage p50/p95 from utils.metrics and process
+# memory, so a regression shows up before deploy.
+#
+#   python -m benchmarks.run_benchmark --sessions 1 10 100 --rows 200000
+#
+# Needs the app's requirements (duckdb included). Caches are cleared between
+# levels unless --warm is given; --unique gives every session its own wording
+# so nothing is shared between sessions either. --plot-code makes Agent 05
+# fall back to generated plot code, which runs in the plot sandbox.
+
+import argparse
+import functools
+import json
+import resource
+import statistics
+import threading
+import time
+
+from benchmarks.fakes import QUESTIONS, FakeBigQueryClient, ScriptedModel, default_script
+from utils import metrics
+from utils.chat_agents import ChatAgents, chat_turn
+from utils.intent_router import IntentRouter
+from utils.llm_cache import llm_cache
+from utils.result_cache import result_cache
+from utils.schema_catalog import schema_catalog
+from utils.semantic_cache import semantic_cache
+from utils.turn_engine import POLL_INTERVAL_SECONDS, turn_engine
+
+
+def run_session(session, questions, agents, client, unique, latencies, failures):
+    for question in questions:
+        text = f"{question} (session {session})" if unique else question
+        started = time.perf_counter()
+        turn = turn_engine.submit((f"bench-{session}", text), functools.partial(
+            chat_turn, user_input=text, agents=agents, client=client))
+        while not turn.done:
+            time.sleep(POLL_INTERVAL_SECONDS / 10)  # The page polls too, just less often
+        latencies.append(time.perf_counter() - started)
+        if turn.status != "done":
+            failures.append((question, [e.value for e in turn.errors()]))
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / 1024 ** 2
+
+
+def run_level(sessions, args, agents, client):
+    metrics.reset()
+    if not args.warm:
+        result_cache.clear()
+        llm_cache.clear()
+        semantic_cache.invalidate()
+    questions = list(QUESTIONS) * args.rounds
+    latencies, failures = [], []
+    rss_before = rss_mb()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=run_session, args=(i, questions, agents, client, args.unique,
+                                                          latencies, failures)) for i in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "sessions": sessions,
+        "turns": len(latencies),
+        "failed": len(failures),
+        "wall_s": round(wall, 2),
+        "turns_per_s": round(len(latencies) / wall, 2),
+        "turn_p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "turn_p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 1),
+        "rss_mb": round(rss_mb(), 1),
+        "rss_growth_mb": round(rss_mb() - rss_before, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "result_cache": result_cache.stats(),
+        "llm_cache": llm_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "stages": metrics.stage_summary(),
+        "errors": failures[:5],
+    }
+
+
+def print_level(report):
+    print(f"\n== {report['sessions']} concurrent sessions ==")
+    print(f"turns {report['turns']} (failed {report['failed']}) in {report['wall_s']} s: "
+          f"{report['turns_per_s']} turns/s, turn p50 {report['turn_p50_ms']} ms, p95 {report['turn_p95_ms']} ms")
+    print(f"memory: rss {report['rss_mb']} MB (+{report['rss_growth_mb']}), peak {report['peak_rss_mb']} MB; "
+          f"result cache hit rate {report['result_cache']['hit_rate']:.0%}")
+    print(f"{'stage':<42}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for row in report["stages"]:
+        print(f"{row['stage']:<42}{row['count']:>7}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['max_ms']:>10.1f}")
+    for question, errors in report["errors"]:
+        print(f"  failed: {question!r}: {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--rows", type=int, default=100_000, help="rows in the synthetic table")
+    parser.add_argument("--rounds", type=int, default=1, help="times each session asks the question list")
+    parser.add_argument("--first-token", type=float, default=0.3, help="fake Gemini time to first token (s)")
+    parser.add_argument("--chunk", type=float, default=0.02, help="fake Gemini delay per streamed chunk (s)")
+    parser.add_argument("--job-latency", type=float, default=0.5, help="extra fake BigQuery job time (s)")
+    parser.add_argument("--warm", action="store_true", help="keep caches between concurrency levels")
+    parser.add_argument("--unique", action="store_true", help="give every session its own question wording")
+    parser.add_argument("--plot-code", action="store_true", help="chart through generated code in the plot sandbox")
+    parser.add_argument("--json", help="also write the reports to this file")
+    args = parser.parse_args()
+
+    model = ScriptedModel(default_script(plot_code=args.plot_code), first_token_seconds=args.first_token,
+                          chunk_seconds=args.chunk)
+    client = FakeBigQueryClient(rows=args.rows, job_latency=args.job_latency)
+    schema_catalog.load(client)
+    agents = ChatAgents(model, model, model, model, model, router=IntentRouter(schema_catalog.column_names))
+
+    reports = []
+    for sessions in args.sessions:
+        report = run_level(sessions, args, agents, client)
+        print_level(report)
+        reports.append(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,15 @@
+import html
+import math
+
 import streamlit as st
-from PIL import Image
+
+from utils.image_assets import thumbnail
+from utils.roster import load_roster
+
+ROSTER_PATH = "data/team_members.json"
+PHOTO_WIDTH = 150
+COLUMNS = 4
+ROWS_PER_PAGE = 5
 
 # Page configuration
 st.set_page_config(page_title="Our Team", page_icon="👥", layout="wide")
@@ -27,28 +37,29 @@ st.markdown("""
 # Title
 st.markdown("<div class='title'>Meet Our Fantastic Team</div>", unsafe_allow_html=True)
 
-# Team members - Update the image paths to point to each file
-team_members = [
-    {"name": "Alice Johnson", "image_path": "/workspaces/test-multipage-web/pages/gojo.jpg"},
-    {"name": "Bob Smith", "image_path": "/workspaces/test-multipage-web/pages/gojo.jpg"},
-    {"name": "Cathy Brown", "image_path": "/workspaces/test-multipage-web/pages/gojo.jpg"},
-    {"name": "David Wilson", "image_path": "/workspaces/test-multipage-web/pages/gojo.jpg"},
-    {"name": "Emma Davis", "image_path": "/workspaces/test-multipage-web/pages/gojo.jpg"},
-    {"name": "Frank Thomas", "image_path": "/workspaces/test-multipage-web/pages/gojo.jpg"},
-    {"name": "Grace Lee", "image_path": "/workspaces/test-multipage-web/pages/gojo.jpg"}
-]
-
-# Display team members in a grid with two rows and four columns
-cols = st.columns(4)  # Creates 4 columns
-
-for i, member in enumerate(team_members):
-    col = cols[i % 4]  # Rotate through columns for each member
-    with col:
-        # Load the image
-        image = Image.open(member["image_path"])
-        
-        # Display the image and name
-        st.image(image, width=150, use_column_width="auto")
-        st.markdown(f"<div class='member-name'>{member['name']}</div>", unsafe_allow_html=True)
+# Team members come from a data file; only the visible page of it is rendered
+team_members = load_roster(ROSTER_PATH)
+
+search = st.text_input("Search by name", placeholder="Type a name...")
+if search:
+    team_members = [m for m in team_members if search.lower() in m["name"].lower()]
+
+per_page = COLUMNS * ROWS_PER_PAGE
+pages = max(1, math.ceil(len(team_members) / per_page))
+page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1) if pages > 1 else 1
+visible = team_members[(page - 1) * per_page:page * per_page]
+
+# Display the visible team members in a grid, four per row
+for row_start in range(0, len(visible), COLUMNS):
+    cols = st.columns(COLUMNS)  # Creates 4 columns
+    for col, member in zip(cols, visible[row_start:row_start + COLUMNS]):
+        with col:
+            # Load the resized image (decoded once and shared by every member using the same photo)
+            if member.get("image_path"):
+                image = thumbnail(member["image_path"], width=PHOTO_WIDTH * 2)  # 2x for HiDPI screens
+                st.image(image, width=PHOTO_WIDTH, use_column_width="auto")
+
+            # Display the name (escaped: roster values are data, not markup)
+            st.markdown(f"<div class='member-name'>{html.escape(member['name'])}</div>", unsafe_allow_html=True)
 
 # End
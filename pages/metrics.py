@@ -0,0 +1,71 @@
+import pandas as pd
+import streamlit as st
+
+from utils import metrics
+from utils.llm_cache import llm_cache
+from utils.local_engine import local_engine
+from utils.query_guard import format_bytes
+from utils.result_cache import result_cache
+from utils.rollups import rollup_store
+from utils.semantic_cache import semantic_cache
+from utils.session_memory import memory_report
+from utils.streaming import time_to_first_token_stats
+from utils.turn_engine import turn_engine
+
+# Admin view of where a chat turn's time goes (all numbers are for this server process)
+st.set_page_config(page_title="Pipeline Metrics", page_icon="📈", layout="wide")
+st.title("Pipeline Metrics")
+
+if st.button("Refresh"):
+    st.rerun()
+
+# Per-stage latency
+st.subheader("Stage latency")
+rows = metrics.stage_summary()
+if rows:
+    st.dataframe(pd.DataFrame(rows).round(1), hide_index=True, use_container_width=True)
+else:
+    st.info("No turns have run since the server started.")
+
+# Tokens, bytes and job counts
+st.subheader("Counters")
+counters = metrics.counters()
+if counters:
+    st.dataframe(pd.DataFrame({"counter": list(counters), "value": list(counters.values())}),
+                 hide_index=True, use_container_width=True)
+    st.caption(f"BigQuery bytes processed: {format_bytes(counters.get('bigquery_bytes_processed', 0))}")
+
+# Caches, turns and memory
+col_1, col_2, col_3, col_4 = st.columns(4)
+with col_1:
+    st.markdown("**Result cache**")
+    st.json(result_cache.stats())
+with col_2:
+    st.markdown("**LLM response cache**")
+    st.json(llm_cache.stats())
+    st.markdown("**Semantic question cache**")
+    st.json(semantic_cache.stats())
+with col_3:
+    st.markdown("**Turn engine**")
+    st.json(turn_engine.stats())
+with col_4:
+    st.markdown("**Local DuckDB engine**")
+    st.json(local_engine.stats() if local_engine.enabled else {"enabled": False})
+    st.markdown("**Rollups**")
+    st.json(rollup_store.stats() if rollup_store.enabled else {"enabled": False})
+
+st.subheader("Time to first token")
+ttft = time_to_first_token_stats()
+if ttft:
+    st.dataframe(pd.DataFrame.from_dict(ttft, orient="index").round(1), use_container_width=True)
+
+st.subheader("Session memory")
+report = memory_report()
+st.caption(f"{format_bytes(report['total_bytes'])} of {format_bytes(report['budget_bytes'])} budget "
+           f"across {len(report['sessions'])} sessions")
+
+# Export
+with st.expander("Prometheus text"):
+    text = metrics.prometheus_text()
+    st.code(text, language="text")
+    st.download_button("Download", text, file_name="metrics.prom", mime="text/plain")
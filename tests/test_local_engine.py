@@ -0,0 +1,43 @@
+# Generated SQL only ever reads the local copy of the sales table
+
+import os
+
+import pytest
+
+pytest.importorskip("duckdb")
+
+from benchmarks.fakes import FakeBigQueryClient
+from utils.local_engine import LocalEngine
+from utils.schema_catalog import TABLE_ID
+
+TABLE = f"`{TABLE_ID}`"
+
+
+@pytest.fixture(scope="module")
+def engine(tmp_path_factory):
+    engine = LocalEngine(directory=str(tmp_path_factory.mktemp("local")))
+    engine.refresh(FakeBigQueryClient(rows=500, job_latency=0))
+    return engine
+
+
+@pytest.mark.parametrize("sql", [
+    f"SELECT * FROM {TABLE}, read_csv('/etc/passwd')",
+    f"SELECT COUNT(*) FROM {TABLE} WHERE ProductId IN (SELECT column0 FROM read_csv('/etc/passwd'))",
+])
+def test_file_access_is_off(engine, sql):
+    assert engine.try_query(sql) is None
+
+
+def test_single_select_only(engine, tmp_path):
+    target = tmp_path / "x.csv"
+    assert engine.try_query(f"COPY (SELECT 1) TO '{target}'; SELECT * FROM {TABLE} LIMIT 1") is None
+    assert engine.try_query(f"SELECT 1 FROM {TABLE}; SET enable_external_access = true") is None
+    assert engine.try_query(f"ATTACH '{tmp_path / 'db'}' AS other") is None
+    assert not os.path.exists(target)
+    assert engine.try_query(f"SELECT COUNT(*) AS n FROM {TABLE};").column("n")[0].as_py() == 500
+
+
+def test_nulls_sort_like_bigquery(engine):
+    sql = f"SELECT NULLIF(Quantity, 1) AS q FROM {TABLE} ORDER BY q {{}} LIMIT 1"
+    assert engine.try_query(sql.format("ASC")).column("q")[0].as_py() is None
+    assert engine.try_query(sql.format("DESC")).column("q")[0].as_py() is not None
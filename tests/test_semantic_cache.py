@@ -0,0 +1,50 @@
+# Paraphrases reuse the cached SQL; questions that only look alike must not
+
+import pytest
+
+from utils.semantic_cache import SemanticCache
+
+SCHEMA = "v1"
+
+SAME_QUESTION = [
+    ("top 10 sales person round trip hours", "which 10 reps have the highest avg round trip"),
+    ("i want to know sale person name and sale person average round trip hours top 10",
+     "show the 10 salespeople with the highest mean round trip hours"),
+    ("i want to know product lens type and Quantity  of each lens type", "quantity for each product lens type"),
+    ("i want to know unique Customer Name  by each province", "distinct customer names per province"),
+    ("i want to know unique Product Id", "show me the distinct product ids"),
+]
+
+DIFFERENT_QUESTION = [
+    ("top 10 sales person by round trip hours", "bottom 10 sales person by round trip hours"),
+    ("top 10 sales person by round trip hours", "lowest 10 sales person by round trip hours"),
+    ("top 10 sales person by round trip hours", "top 5 sales person by round trip hours"),
+    ("quantity by product lens type sorted ascending", "quantity by product lens type sorted descending"),
+    ("i want to know unique Product Id", "count of unique Product Id"),
+    ("total quantity by customer country", "total quantity by customer country excluding Thailand"),
+    ("average quantity by product lens type", "quantity by product lens type"),
+    ("quantity by product lens type", "quantity by product material type"),
+    ("i want to know sale person name and sale person average round trip hours top 10 for customers in thailand only",
+     "i want to know sale person name and sale person average round trip hours top 10 for customers in japan only"),
+]
+
+
+@pytest.mark.parametrize("stored, asked", SAME_QUESTION)
+def test_paraphrase_reuses_sql(stored, asked):
+    cache = SemanticCache()
+    cache.add(stored, "SELECT 1", SCHEMA)
+    assert cache.lookup(asked, SCHEMA) == "SELECT 1"
+
+
+@pytest.mark.parametrize("stored, asked", DIFFERENT_QUESTION)
+def test_different_question_misses(stored, asked):
+    for first, second in ((stored, asked), (asked, stored)):
+        cache = SemanticCache()
+        cache.add(first, "SELECT 1", SCHEMA)
+        assert cache.lookup(second, SCHEMA) is None
+
+
+def test_schema_change_drops_entries():
+    cache = SemanticCache()
+    cache.add("quantity by product lens type", "SELECT 1", SCHEMA)
+    assert cache.lookup("quantity by product lens type", "v2") is None
@@ -0,0 +1,2 @@
+# Shared helpers for the chatbot pages (kept outside pages/ so Streamlit
+# doesn't list them as pages).
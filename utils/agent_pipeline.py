@@ -0,0 +1,16 @@
+# Shared thread pool for blocking agent calls
+#
+# Gemini and BigQuery calls block, so the turn engine runs each stage (and
+# each step of a streamed response) on this pool and awaits the Future.
+# Streamlit calls must stay on the script thread: stages only compute, the
+# page renders.
+
+from concurrent.futures import ThreadPoolExecutor
+
+# Shared by all sessions; Gemini calls are I/O bound so threads are enough
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="agent-stage")
+
+
+def submit(func, *args):
+    """Run a single call on the shared stage pool and return its Future."""
+    return _executor.submit(func, *args)
@@ -0,0 +1,135 @@
+# Process-wide BigQuery client pool
+#
+# Building a client from a service account key means a new auth handshake and
+# a new HTTP session, so clients are kept here for the life of the server
+# process, keyed by a fingerprint of the key JSON. Every session and every
+# page that uploads the same key gets the same client back.
+# credential_namespace() tells which service account a client queries as, so
+# the result cache only shares results between sessions using the same one.
+
+import hashlib
+import json
+import threading
+import time
+import weakref
+from datetime import datetime, timedelta, timezone
+
+import google.auth.transport.requests
+from google.cloud import bigquery
+from google.oauth2 import service_account
+
+IDLE_TIMEOUT_SECONDS = 30 * 60                  # Drop clients nobody used for 30 minutes
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)     # Refresh tokens this long before they expire
+SWEEP_INTERVAL_SECONDS = 60
+
+_lock = threading.Lock()
+_pool = {}              # fingerprint -> entry dict (client, credentials, last_used, lock)
+_namespaces = weakref.WeakKeyDictionary()   # client -> credential fingerprint, see credential_namespace
+_sweeper = None
+
+
+def fingerprint_service_account(info):
+    """Stable hash of a service account key, used as the pool key."""
+    payload = json.dumps(info, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+def fingerprint_credential(info):
+    """Hash of who a key queries as: its client_email and private_key_id."""
+    payload = f"{info.get('client_email', '')}\n{info.get('private_key_id', '')}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+def credential_namespace(client):
+    """Result cache namespace for `client`: its credential's fingerprint. Clients
+    not built here (e.g. the benchmark's fake) fall back to their project."""
+    with _lock:
+        fingerprint = _namespaces.get(client)
+    return fingerprint or f"project:{client.project}"
+
+
+def _utcnow():
+    # google-auth keeps expiry as a naive UTC datetime
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _refresh_if_expiring(entry):
+    credentials = entry["credentials"]
+    expiry = credentials.expiry
+    if credentials.token and expiry and expiry - _utcnow() > TOKEN_REFRESH_MARGIN:
+        return
+    with entry["lock"]:
+        # Another thread may have refreshed while we waited for the lock
+        expiry = credentials.expiry
+        if credentials.token and expiry and expiry - _utcnow() > TOKEN_REFRESH_MARGIN:
+            return
+        credentials.refresh(google.auth.transport.requests.Request())
+
+
+def _build_entry(info):
+    credentials = service_account.Credentials.from_service_account_info(
+        info, scopes=list(bigquery.Client.SCOPE)
+    )
+    client = bigquery.Client(project=info.get("project_id"), credentials=credentials)
+    _namespaces[client] = fingerprint_credential(info)   # Caller holds _lock
+    return {
+        "client": client,
+        "credentials": credentials,
+        "last_used": time.monotonic(),
+        "lock": threading.Lock(),
+    }
+
+
+def get_bigquery_client(info):
+    """Return the pooled client for this service account key, creating it once."""
+    key = fingerprint_service_account(info)
+    with _lock:
+        entry = _pool.get(key)
+        if entry is None:
+            entry = _build_entry(info)
+            _pool[key] = entry
+        entry["last_used"] = time.monotonic()
+        _start_sweeper()
+    _refresh_if_expiring(entry)
+    return entry["client"]
+
+
+def evict_idle_clients(max_idle=IDLE_TIMEOUT_SECONDS):
+    """Close and drop clients that have not been used for `max_idle` seconds."""
+    now = time.monotonic()
+    with _lock:
+        stale = [key for key, entry in _pool.items() if now - entry["last_used"] > max_idle]
+        evicted = [_pool.pop(key) for key in stale]
+    for entry in evicted:
+        try:
+            entry["client"].close()
+        except Exception:
+            pass
+    return len(evicted)
+
+
+def pool_size():
+    with _lock:
+        return len(_pool)
+
+
+def _sweep_forever():
+    while True:
+        time.sleep(SWEEP_INTERVAL_SECONDS)
+        evict_idle_clients()
+        with _lock:
+            entries = list(_pool.values())
+        for entry in entries:
+            try:
+                _refresh_if_expiring(entry)
+            except Exception:
+                # A failed background refresh is retried on the next checkout
+                pass
+
+
+def _start_sweeper():
+    # Called with _lock held
+    global _sweeper
+    if _sweeper is None or not _sweeper.is_alive():
+        _sweeper = threading.Thread(target=_sweep_forever, name="bigquery-client-sweeper", daemon=True)
+        _sweeper.start()
@@ -0,0 +1,134 @@
+# Deterministic chart picker for query results
+#
+# recommend_chart() looks at the result's dtypes and cardinality and picks a
+# plotly express chart (bar / line / scatter / pie / histogram) together with
+# the columns to use. build_chart() then plots the DataFrame we already have,
+# with no data retyped by the LLM and no generated code. When the rules can't
+# decide, chart_spec_prompt() / parse_chart_spec() ask the LLM for a small
+# JSON spec in the same shape instead of a whole program.
+
+import json
+import re
+
+import pandas as pd
+import plotly.express as px
+
+CHART_KINDS = ("bar", "line", "scatter", "pie", "histogram")
+MAX_BAR_CATEGORIES = 50
+MAX_PIE_SLICES = 6
+MAX_COLOR_GROUPS = 10
+
+NO_CHART = {"kind": None, "x": None, "y": None, "color": None}
+
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+
+def _is_temporal(column):
+    if pd.api.types.is_datetime64_any_dtype(column) or str(column.dtype) == "dbdate":
+        return True
+    if column.dtype == object:
+        sample = column.dropna().head(1)
+        return bool(len(sample)) and hasattr(sample.iloc[0], "isoformat")
+    return False
+
+
+def column_roles(df):
+    """Split columns into (numeric, temporal, categorical) name lists."""
+    numeric, temporal, categorical = [], [], []
+    for name in df.columns:
+        column = df[name]
+        if _is_temporal(column):
+            temporal.append(name)
+        elif pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column):
+            numeric.append(name)
+        else:
+            categorical.append(name)
+    return numeric, temporal, categorical
+
+
+def _color_for(df, candidates, exclude=()):
+    for name in candidates:
+        if name not in exclude and df[name].nunique() <= MAX_COLOR_GROUPS:
+            return name
+    return None
+
+
+def recommend_chart(df):
+    """Chart spec {"kind", "x", "y", "color"} for `df`. NO_CHART when a chart would
+    be pointless (empty or single-row results), None when the rules can't tell."""
+    if df is None or df.empty or len(df) < 2:
+        return NO_CHART
+    numeric, temporal, categorical = column_roles(df)
+
+    if temporal and numeric:
+        return {"kind": "line", "x": temporal[0], "y": numeric[0], "color": _color_for(df, categorical)}
+
+    if categorical and numeric:
+        x, y = categorical[0], numeric[0]
+        if (len(categorical) == 1 and len(numeric) == 1 and df[x].nunique() <= MAX_PIE_SLICES
+                and df[x].is_unique and (df[y] >= 0).all()):
+            return {"kind": "pie", "x": x, "y": y, "color": None}
+        return {"kind": "bar", "x": x, "y": y, "color": _color_for(df, categorical, exclude=(x,))}
+
+    if len(numeric) >= 2:
+        return {"kind": "scatter", "x": numeric[0], "y": numeric[1], "color": _color_for(df, categorical)}
+
+    if numeric:
+        return {"kind": "histogram", "x": numeric[0], "y": None, "color": None}
+
+    # Only text columns: counting repeated values is the one useful chart
+    if categorical and not df[categorical[0]].is_unique:
+        return {"kind": "histogram", "x": categorical[0], "y": None, "color": _color_for(df, categorical[1:])}
+    return None
+
+
+def build_chart(df, spec):
+    """Plotly figure for `df` drawn as described by `spec`."""
+    kind, x, y, color = spec["kind"], spec["x"], spec.get("y"), spec.get("color")
+    if kind == "pie":
+        return px.pie(df, names=x, values=y)
+    if kind == "histogram":
+        return px.histogram(df, x=x, color=color)
+    if kind == "line":
+        return px.line(df.sort_values(x), x=x, y=y, color=color, markers=True)
+    if kind == "scatter":
+        return px.scatter(df, x=x, y=y, color=color)
+    if y is not None and len(df) > MAX_BAR_CATEGORIES and pd.api.types.is_numeric_dtype(df[y]):
+        df = df.nlargest(MAX_BAR_CATEGORIES, y)     # Keep the bar chart readable
+    return px.bar(df, x=x, y=y, color=color)
+
+
+def chart_spec_prompt(df):
+    """Short prompt asking the LLM for a chart spec; no data rows are sent."""
+    columns = ", ".join(f"{name} ({dtype}, {df[name].nunique()} distinct)" for name, dtype in df.dtypes.items())
+    return f"""Pick a plotly express chart for a DataFrame with {len(df)} rows and these columns: {columns}.
+    Reply with JSON only, in this form:
+    {{"kind": "bar" | "line" | "scatter" | "pie" | "histogram", "x": "<column>", "y": "<column or null>", "color": "<column or null>"}}
+    Reply {{"kind": null}} if no chart fits."""
+
+
+def parse_chart_spec(text, df):
+    """Validated chart spec from an LLM reply, NO_CHART if the LLM said no chart
+    fits, or None if the reply is unusable."""
+    match = _JSON_OBJECT.search(text or "")
+    if not match:
+        return None
+    try:
+        spec = json.loads(match.group(0))
+    except ValueError:
+        return None
+    if not isinstance(spec, dict):
+        return None
+    if "kind" in spec and spec["kind"] is None:
+        return NO_CHART
+    if spec.get("kind") not in CHART_KINDS:
+        return None
+    spec = {key: spec.get(key) for key in ("kind", "x", "y", "color")}
+    if spec["x"] not in df.columns:
+        return None
+    for key in ("y", "color"):
+        if spec[key] is not None and spec[key] not in df.columns:
+            spec[key] = None
+    if spec["kind"] not in ("histogram", "pie") and spec["y"] is None:
+        return None
+    return spec
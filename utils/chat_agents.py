@@ -0,0 +1,290 @@
+# The V2 / V3 chat pipeline, shared by both pages and the benchmark
+#
+# ChatAgents wraps the five Gemini agents (categorize, SQL, conversation,
+# answer, chart) and their prompts. chat_turn() is one turn of the pipeline:
+# route -> SQL -> BigQuery -> answer -> chart. It runs on the background turn
+# engine and records each step on the Turn. show_turn() and finish_turn() draw
+# that Turn on the page. Every stage has a time limit (STAGE_TIMEOUTS), and the
+# turn engine ends the whole turn after TURN_TIMEOUT_SECONDS, so a hung Gemini
+# stream can't keep the chat input disabled.
+
+import asyncio
+
+import plotly.io as pio
+import streamlit as st
+
+from utils import metrics
+from utils.bigquery_client import get_bigquery_client
+from utils.chart_builder import build_chart, chart_spec_prompt, parse_chart_spec, recommend_chart
+from utils.llm_cache import llm_cache, model_name, response_key
+from utils.plot_sandbox import get_plot_sandbox
+from utils.result_cache import run_cached_query
+from utils.result_digest import digest_dataframe
+from utils.result_viewer import show_result_notes
+from utils.schema_catalog import schema_catalog
+from utils.semantic_cache import semantic_cache
+from utils.sql_candidates import CANDIDATE_COUNT, run_best_query, run_or_repair
+from utils.streaming import track_first_token
+
+# Per-stage time limits (seconds); streamed stages count from the request to the last chunk
+STAGE_TIMEOUTS = {
+    "route": 30,
+    "chat": 60,
+    "sql": 60,
+    "candidates": 120,
+    "query": 180,
+    "answer": 60,
+    "graph": 90,
+    "figure": 60,
+}
+
+
+def clean_sql(bot_response):
+    clean_format_sql = bot_response.strip().replace('\n', ' ').replace('sql', '').replace('   ',' ').replace('```','').strip()
+    return clean_format_sql
+
+
+def clean_plot_code(code):
+    return code.replace('```','').replace('python','').strip()
+
+
+class ChatAgents:
+    """Agent 01-05 of the chat pages. Cached responses are keyed on the schema
+    catalog's version, so they go stale with the schema. `router` (an
+    IntentRouter) answers most routing decisions before Agent 01 is asked."""
+
+    def __init__(self, categorize_model, sql_model, conversation_model, answer_model, graph_model, router=None):
+        self.categorize_model = categorize_model
+        self.sql_model = sql_model
+        self.conversation_model = conversation_model
+        self.answer_model = answer_model
+        self.graph_model = graph_model
+        self.router = router
+
+    ## Agent 01: Categorize User Input
+    def categorize_task(self, user_input):
+        categorize_prompt = f"""Categorize the following user input into one of two categories, you will return only 01 or 02::
+                        - "01" : query_question if it's a question or requirement or any wording that about retrieving data from a database base on {schema_catalog.prompt_fragment(user_input)}
+                        - "02" : common_conversation if it's a general conversation such as greeting, general question, and anything else.
+                        User input: "{user_input}" """
+        return llm_cache.generate(self.categorize_model, categorize_prompt, agent="categorize_task",
+                                  schema=schema_catalog.version).strip()
+
+    def route(self, user_input):
+        if self.router is None:
+            return self.categorize_task(user_input)
+        return self.router.route(user_input, fallback=self.categorize_task).label
+
+    ## Agent 02: Query data from Big query
+    def sql_prompt_for(self, user_input):
+        return f"""You are an AI assistant that transforms user questions into SQL queries to retrieve data from a BigQuery database.
+                  {schema_catalog.prompt_fragment(user_input)} Use this information to generate accurate SQL queries based on user input.
+                  Generate a SQL query based on the user's input: '{user_input}'."""
+
+    def generate_sql_query(self, user_input, stream=False):
+        sql_prompt = self.sql_prompt_for(user_input)
+        if stream:
+            # Raw chunks for st.write_stream; pass the joined text through clean_sql afterwards
+            return llm_cache.stream(self.sql_model, sql_prompt, agent="generate_sql_query", schema=schema_catalog.version)
+        bot_response = llm_cache.generate(self.sql_model, sql_prompt, agent="generate_sql_query", schema=schema_catalog.version)
+        return clean_sql(bot_response)
+
+    def forget_sql_query(self, user_input):
+        # The cached SQL failed the guard or BigQuery; the next ask goes back to Agent 02
+        llm_cache.delete(response_key("generate_sql_query", model_name(self.sql_model),
+                                      self.sql_prompt_for(user_input), schema_catalog.version))
+
+    ## Agent 03: Respond to General Conversation
+    def general_conversation(self, user_input, stream=False):
+        conversation_prompt = f"""Respond to this user input in a friendly conversational style: "{user_input}" """
+        if stream:
+            return llm_cache.stream(self.conversation_model, conversation_prompt, agent="general_conversation",
+                                    schema=schema_catalog.version)
+        return llm_cache.generate(self.conversation_model, conversation_prompt, agent="general_conversation",
+                                  schema=schema_catalog.version).strip()
+
+    # Agent 04: Transform SQL Query Result into Conversational Answer
+    def sql_result_to_conversation(self, result_data, stream=False):
+        # Only a bounded digest of the result goes into the prompt, however many rows came back
+        result_prompt = f"""Take the following structured SQL query result and create a friendly answer: "{digest_dataframe(result_data)}" """
+        if stream:
+            return llm_cache.stream(self.answer_model, result_prompt, agent="sql_result_to_conversation",
+                                    schema=schema_catalog.version)
+        return llm_cache.generate(self.answer_model, result_prompt, agent="sql_result_to_conversation",
+                                  schema=schema_catalog.version).strip()
+
+    # Agent 05: Transform Pandas dataframe into python code for plot the chart (last resort, see plan_graph)
+    def TF_graph(self, result_data):
+        result_prompt = f"""Generate Python code to:
+    1. Use the existing Pandas DataFrame named `df` (do not redefine it), summarized here: {digest_dataframe(result_data)}.
+    2. Use plotly express to create a suitable graph based on the DataFrame structure and color by data.
+    3. Return only executable Python code without markdown formatting or comments.
+    The code should be fully executable in a Python environment and ready to display"""
+        return llm_cache.generate(self.graph_model, result_prompt, agent="TF_graph", schema=schema_catalog.version).strip()
+
+    def plan_graph(self, result_data):
+        # Agent 05 Working: a small JSON chart spec first, generated plot code only if that fails
+        reply = llm_cache.generate(self.graph_model, chart_spec_prompt(result_data), agent="chart_spec",
+                                   schema=schema_catalog.version)
+        spec = parse_chart_spec(reply, result_data)
+        if spec:
+            return {"spec": spec}
+        return {"code": self.TF_graph(result_data)}
+
+
+def repair_query(turn, client, agents, user_input, sql_query):
+    # Runs on the stage pool; the SQL shown on the page is replaced when Agent 02 repaired it
+    sql_query, result, attempts = run_or_repair(client, agents.sql_model, agents.sql_prompt_for(user_input),
+                                                "generate_sql_query", schema_catalog.version, sql_query, clean_sql)
+    if attempts:
+        turn.emit("sql", sql_query)
+    return result
+
+
+def make_figure(result_data, graph):
+    # Excute The graph (in the background turn, so no Streamlit calls here)
+    if "spec" in graph:
+        if graph["spec"]["kind"] is None:
+            return None  # Nothing worth plotting (e.g. a single row)
+        return build_chart(result_data, graph["spec"])    # Plots the DataFrame we already have
+
+    # Run the generated code in a sandboxed worker; only the figure's JSON comes back
+    fig_json = get_plot_sandbox().run(clean_plot_code(graph["code"]), result_data)  # The code plots the real result as `df`
+    return pio.from_json(fig_json) if fig_json else None  # The code is expected to store it in `fig`
+
+
+def connect(service_account_info):
+    if not service_account_info:
+        raise ValueError("Please upload a valid Google Service Account Key file.")
+    return get_bigquery_client(service_account_info)
+
+
+async def chat_turn(turn, user_input, agents, service_account_info=None, client=None):
+    """One chat turn, run by the turn engine so page reruns don't restart it. Nothing
+    in here touches Streamlit: each step is recorded on `turn` and the page draws it
+    (see show_turn). `client` is used as is when given (the benchmark's fake)."""
+    task_type = await turn.run("route", agents.route, user_input, timeout=STAGE_TIMEOUTS["route"])
+
+    if int(task_type) != 1:
+        # Agent 03 Working
+        await turn.stream("chat", track_first_token(agents.general_conversation(user_input, stream=True), "general_conversation"),
+                          timeout=STAGE_TIMEOUTS["chat"])
+        return
+
+    client = client or connect(service_account_info)
+    schema_catalog.ensure_fresh(client)  # Background refresh, only when stale
+
+    cached_sql = semantic_cache.lookup(user_input, schema_catalog.version)
+    if cached_sql:
+        # A paraphrase of a question whose SQL already ran: no Agent 02 call at all,
+        # and usually a result cache hit as well
+        sql_query = cached_sql
+        turn.emit("sql", sql_query)
+        result = await turn.run("query", run_cached_query, client, sql_query, timeout=STAGE_TIMEOUTS["query"])
+    elif CANDIDATE_COUNT > 1:
+        # Agent 02 writes a few candidates; the cheapest one that passes a dry run is executed,
+        # and BigQuery errors go back to Agent 02 for a repair round
+        sql_query, result, attempts = await turn.run("candidates", run_best_query, client, agents.sql_model,
+                                                     agents.sql_prompt_for(user_input), "generate_sql_query",
+                                                     schema_catalog.version, clean_sql, timeout=STAGE_TIMEOUTS["candidates"])
+        turn.emit("sql", sql_query)
+        turn.emit("query", result)
+    else:
+        # Agent 02 Working, streamed as it is generated
+        raw_sql = await turn.stream("sql", track_first_token(agents.generate_sql_query(user_input, stream=True), "generate_sql_query"),
+                                    timeout=STAGE_TIMEOUTS["sql"])
+        sql_query = clean_sql(raw_sql)
+        turn.emit("sql", sql_query)
+        # Served from the shared result cache when someone already ran this SQL;
+        # otherwise dry-run first and refused if it would scan too much. A rejected
+        # query goes back to Agent 02 with the error for a repair round
+        try:
+            result = await turn.run("query", repair_query, turn, client, agents, user_input, sql_query,
+                                    timeout=STAGE_TIMEOUTS["query"])
+        except Exception:
+            agents.forget_sql_query(user_input)
+            raise
+        sql_query = turn.result("sql")
+    semantic_cache.add(user_input, sql_query, schema_catalog.version)   # It ran, so later paraphrases may reuse it
+    result_data = result.df
+
+    # Most results get a chart straight from their dtypes; Agent 05 is only asked
+    # (at the same time as the answer streams) when the rules can't decide
+    spec = recommend_chart(result_data)    # None means the rules can't tell
+    if spec:
+        turn.emit("graph", {"spec": spec})
+        graph_task = None
+    else:
+        graph_task = asyncio.ensure_future(turn.run("graph", agents.plan_graph, result_data, timeout=STAGE_TIMEOUTS["graph"]))
+
+    try:
+        # Agent 04: the SQL query result in conversational human language
+        try:
+            await turn.stream("answer", track_first_token(agents.sql_result_to_conversation(result_data, stream=True),
+                                                          "sql_result_to_conversation"), timeout=STAGE_TIMEOUTS["answer"])
+        except asyncio.TimeoutError:
+            pass  # Recorded on the turn; the chart can still be shown
+
+        graph = {"spec": spec} if spec else await graph_task
+    finally:
+        if graph_task is not None:
+            graph_task.cancel()   # The turn failed or ran out of time; don't leave the chart agent behind
+    await turn.run("figure", make_figure, result_data, graph, timeout=STAGE_TIMEOUTS["figure"])
+
+
+def show_graph(graph, plotly_fig):
+    # Check if the plotly figure is generated
+    if plotly_fig is not None:
+        # Display the graph in the chatbot
+        st.chat_message("assistant").markdown("Here is the graph to represent the query:")
+        with metrics.span("plotly_chart"):
+            st.plotly_chart(plotly_fig)  # Render the Plotly figure in Streamlit
+
+    elif graph and "code" in graph:
+        # If no figure is found, notify the user
+        st.chat_message("assistant").markdown("The code was executed successfully, but no graph was generated.")
+
+
+def show_turn(turn):
+    # Draw what the background turn has produced so far; called on every rerun until it is done
+    sql_query = turn.result("sql") or turn.text("sql")
+    if sql_query:
+        st.chat_message("assistant").markdown(sql_query)
+    if turn.result("query") is not None:
+        show_result_notes(turn.result("query"))
+
+    for stage in ("answer", "chat"):
+        text = turn.result(stage) or turn.text(stage)
+        if text:
+            st.chat_message("assistant").markdown(text)
+
+    graph = turn.result("graph")
+    for event in turn.events():
+        if event.stage == "figure" and event.kind == "result":
+            show_graph(graph, event.value)
+
+    for event in turn.errors():
+        st.chat_message("assistant").markdown(f"**Error:** {event.stage} step failed: {event.value}")
+
+    if not turn.done:
+        st.caption("Working on it...")
+
+
+def finish_turn(turn, show_plot_code=False):
+    # Move the finished turn into the chat history and the result viewer
+    if turn.result("sql"):
+        st.session_state.chat_history.append(("assistant", turn.result("sql")))
+    answer = turn.result("answer") or turn.text("answer")    # Partial when the answer timed out
+    if answer:
+        st.session_state.chat_history.append(("assistant", answer.strip()))
+    if show_plot_code and turn.result("graph") and "code" in turn.result("graph"):
+        st.session_state.chat_history.append(("assistant", clean_plot_code(turn.result("graph")["code"])))
+    chat = turn.result("chat") or turn.text("chat")
+    if chat:
+        st.session_state.chat_history.append(("ai", chat.strip()))
+    for event in turn.errors():
+        st.session_state.chat_history.append(("assistant", f"**Error:** {event.stage} step failed: {event.value}"))
+    if turn.result("query") is not None:
+        st.session_state.last_result = turn.result("query")  # Shown page by page below the chat
+        st.session_state.last_sql = turn.result("sql")
+    st.session_state.active_turn = None
@@ -0,0 +1,147 @@
+# Bounded chat history for a Streamlit session
+#
+# Only the most recent messages stay in memory. Older ones are appended to a
+# small per-session JSONL log on disk and read back only when the user asks
+# to see them. render_chat_history() draws just the visible tail, so a rerun
+# costs the same however long the conversation has been going. The log is
+# readable by its owner only, is deleted once the session's history object is
+# garbage collected (the session ended), and logs left behind by a crash are
+# swept after CHAT_LOG_RETENTION_SECONDS.
+
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from collections import deque
+
+import streamlit as st
+
+MAX_LIVE_MESSAGES = int(os.environ.get("CHAT_MAX_LIVE_MESSAGES", 40))
+VISIBLE_MESSAGES = int(os.environ.get("CHAT_VISIBLE_MESSAGES", 20))
+MAX_SIDEBAR_PROMPTS = int(os.environ.get("CHAT_MAX_SIDEBAR_PROMPTS", 30))
+LOG_DIR = os.environ.get("CHAT_LOG_DIR") or os.path.join(tempfile.gettempdir(), "chatbot_history")
+RETENTION_SECONDS = int(os.environ.get("CHAT_LOG_RETENTION_SECONDS", 24 * 60 * 60))
+SWEEP_INTERVAL_SECONDS = 60 * 60
+
+_sweep_lock = threading.Lock()
+_last_sweep = {}    # log dir -> time of the last retention sweep
+
+
+def _remove_log(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def sweep_logs(log_dir=LOG_DIR, retention_seconds=RETENTION_SECONDS):
+    """Delete logs nobody has written to for `retention_seconds` (sessions that
+    ended without their history being collected, e.g. after a crash)."""
+    cutoff = time.time() - retention_seconds
+    try:
+        names = os.listdir(log_dir)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(log_dir, name)
+        try:
+            if name.endswith(".jsonl") and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def _maybe_sweep(log_dir):
+    with _sweep_lock:
+        if time.time() - _last_sweep.get(log_dir, 0) < SWEEP_INTERVAL_SECONDS:
+            return
+        _last_sweep[log_dir] = time.time()
+    sweep_logs(log_dir)
+
+
+class ChatHistory:
+    def __init__(self, session_id=None, max_live=MAX_LIVE_MESSAGES, log_dir=LOG_DIR):
+        self.session_id = session_id or uuid.uuid4().hex
+        self.max_live = max_live
+        self.path = os.path.join(log_dir, f"{self.session_id}.jsonl")
+        self.live = deque()
+        self.spilled = 0            # Messages that only exist in the log file
+        # session_memory may trim this history from another session's thread
+        self._lock = threading.RLock()
+        os.makedirs(log_dir, mode=0o700, exist_ok=True)
+        _maybe_sweep(log_dir)
+        # The session's state is dropped when it ends; its log goes with it
+        weakref.finalize(self, _remove_log, self.path)
+
+    def __len__(self):
+        with self._lock:
+            return self.spilled + len(self.live)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self.live))
+
+    def append(self, item):
+        role, message = item
+        with self._lock:
+            self.live.append((role, message))
+            if len(self.live) > self.max_live:
+                # Spill half at a time so the file isn't touched on every message
+                self._spill(len(self.live) - self.max_live // 2)
+
+    def clear(self):
+        with self._lock:
+            self.live.clear()
+            self.spilled = 0
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def trim(self, keep=VISIBLE_MESSAGES):
+        """Spill all but the last `keep` messages to disk (used under memory pressure)."""
+        with self._lock:
+            if len(self.live) > keep:
+                self._spill(len(self.live) - keep)
+
+    def nbytes(self):
+        with self._lock:
+            return sum(len(role) + len(message) for role, message in self.live)
+
+    def tail(self, count):
+        """The last `count` messages, reading older ones back from disk if needed."""
+        with self._lock:
+            if count <= len(self.live):
+                return list(self.live)[len(self.live) - count:]
+            older = self._read_spilled(count - len(self.live))
+            return older + list(self.live)
+
+    def _spill(self, count):
+        # Chat content: created readable and writable by the server's user only
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        with open(fd, "a", encoding="utf-8") as f:
+            for _ in range(count):
+                role, message = self.live.popleft()
+                f.write(json.dumps([role, message], ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.spilled += count
+
+    def _read_spilled(self, count):
+        if not self.spilled or not os.path.exists(self.path):
+            return []
+        with open(self.path, encoding="utf-8") as f:
+            lines = deque(f, maxlen=count)
+        return [tuple(json.loads(line)) for line in lines]
+
+
+def render_chat_history(history, key="chat"):
+    """Draw the visible tail of `history`, with a button to reveal earlier messages."""
+    visible_key = f"{key}_visible"
+    visible = st.session_state.get(visible_key, VISIBLE_MESSAGES)
+    hidden = len(history) - visible
+    if hidden > 0 and st.button(f"Show earlier messages ({hidden} hidden)", key=f"{key}_more"):
+        visible += VISIBLE_MESSAGES
+    st.session_state[visible_key] = visible
+
+    for role, message in history.tail(min(visible, len(history))):
+        st.chat_message(role).markdown(message)
@@ -0,0 +1,79 @@
+# Resized, cached image assets for the static pages
+#
+# Each image file is decoded once per process and turned into WebP variants
+# of the sizes the pages actually show. Variants are memoized in memory and
+# written to ASSET_CACHE_DIR, keyed by a hash of the file's content, so the
+# same photo used for several people (or under several paths) is only
+# processed once. A file is only re-hashed when its mtime or size changes.
+
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from functools import lru_cache
+
+from PIL import Image
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.environ.get("ASSET_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "chatbot_assets")
+WEBP_QUALITY = 80
+
+_decode_lock = threading.Lock()
+_paths = {}     # content hash -> a path with that content; kept out of the memo keys
+
+
+def asset_path(path):
+    """Absolute path for an asset given relative to the app root."""
+    return path if os.path.isabs(path) else os.path.join(APP_ROOT, path)
+
+
+@lru_cache(maxsize=1024)
+def _content_hash(path, mtime_ns, size):
+    # mtime / size are only part of the key so edits to the file invalidate it
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=64)
+def _decoded(content_hash):
+    with _decode_lock, Image.open(_paths[content_hash]) as image:
+        image.load()
+        return image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+
+
+@lru_cache(maxsize=512)
+def _variant(content_hash, width):
+    cache_file = os.path.join(CACHE_DIR, f"{content_hash[:20]}_{width}.webp")
+    if os.path.exists(cache_file):
+        with open(cache_file, "rb") as f:
+            return f.read()
+
+    image = _decoded(content_hash)
+    if width and image.width > width:
+        height = round(image.height * width / image.width)
+        image = image.resize((width, height), Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, format="WEBP", quality=WEBP_QUALITY, method=4)
+    data = buffer.getvalue()
+
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(cache_file + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(cache_file + ".tmp", cache_file)
+    except OSError:
+        pass  # The disk cache is best effort
+    return data
+
+
+def thumbnail(path, width):
+    """WebP bytes of the image at `path`, at most `width` pixels wide."""
+    path = asset_path(path)
+    stat = os.stat(path)
+    content_hash = _content_hash(path, stat.st_mtime_ns, stat.st_size)
+    _paths[content_hash] = path
+    return _variant(content_hash, width)
@@ -0,0 +1,109 @@
+# Local intent router for Agent 01
+#
+# Decides whether a message is a data question ("01") or general conversation
+# ("02") by matching it against the schema's column names and a few cue words.
+# Only when the local score is not confident enough is the LLM asked, and its
+# answer is remembered so the same message is decided locally next time.
+
+import math
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from utils.schema_catalog import column_words
+
+QUERY_QUESTION = "01"
+COMMON_CONVERSATION = "02"
+
+Decision = namedtuple("Decision", ["label", "confidence", "escalated", "latency_ms"])
+
+QUERY_CUES = {
+    "top", "unique", "distinct", "count", "total", "sum", "average", "avg", "mean",
+    "max", "maximum", "min", "minimum", "list", "show", "each", "per", "group",
+    "most", "least", "highest", "lowest", "trend", "compare", "number", "query",
+    "sql", "table", "rank", "sort", "filter", "monthly", "yearly", "daily",
+}
+QUERY_PHRASES = ("want to know", "how many", "how much", "break down", "group by", "order by")
+
+CHAT_CUES = {
+    "hi", "hello", "hey", "thanks", "thank", "thx", "bye", "goodbye", "morning",
+    "afternoon", "evening", "night", "joke", "weather", "who", "yourself", "you",
+}
+CHAT_PHRASES = ("good morning", "good afternoon", "good evening", "how are you", "nice to meet", "see you")
+
+# Column words that also show up in everyday chat count for less
+GENERIC_WORDS = {"id", "name", "type", "date", "no", "item", "cause"}
+
+# Extra words users type for columns in this schema
+SYNONYMS = {"sales", "sale", "salesperson", "revenue", "orders", "order", "products", "customers", "lenses"}
+
+_WORD = re.compile(r"[a-z0-9_]+")
+
+
+class IntentRouter:
+    def __init__(self, columns, threshold=0.75, memory_size=1024):
+        self.vocabulary = column_words(columns) | SYNONYMS
+        self.threshold = threshold
+        self.memory_size = memory_size
+        self._learned = OrderedDict()   # normalized text -> label decided by the LLM
+        self._lock = threading.Lock()
+        self._stats = {"decisions": 0, "escalations": 0, "local_ms": 0.0, "escalated_ms": 0.0}
+
+    def score(self, text):
+        """(label, confidence) from the local rules alone."""
+        lowered = text.lower()
+        words = _WORD.findall(lowered)
+
+        schema_score = sum(0.5 if w in GENERIC_WORDS else 1.5 for w in words if w in self.vocabulary)
+        query_score = schema_score
+        query_score += sum(1.0 for w in words if w in QUERY_CUES)
+        query_score += sum(1.0 for p in QUERY_PHRASES if p in lowered)
+
+        chat_score = sum(1.0 for w in words if w in CHAT_CUES)
+        chat_score += sum(1.5 for p in CHAT_PHRASES if p in lowered)
+        if query_score < 1:
+            chat_score += 0.75  # Nothing data-like at all leans towards conversation
+
+        margin = query_score - chat_score
+        confidence = 1 / (1 + math.exp(-abs(margin)))
+        return (QUERY_QUESTION if margin > 0 else COMMON_CONVERSATION), confidence
+
+    def route(self, text, fallback=None):
+        """Decide locally, calling `fallback(text)` (the LLM) only when unsure."""
+        started = time.perf_counter()
+        key = " ".join(_WORD.findall(text.lower()))
+        with self._lock:
+            learned = self._learned.get(key)
+        if learned is not None:
+            label, confidence = learned, 1.0
+        else:
+            label, confidence = self.score(text)
+
+        escalated = confidence < self.threshold and fallback is not None
+        if escalated:
+            answer = str(fallback(text)).strip()
+            label = QUERY_QUESTION if answer.endswith("1") else COMMON_CONVERSATION
+            with self._lock:
+                self._learned[key] = label
+                while len(self._learned) > self.memory_size:
+                    self._learned.popitem(last=False)
+
+        latency_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._stats["decisions"] += 1
+            if escalated:
+                self._stats["escalations"] += 1
+                self._stats["escalated_ms"] += latency_ms
+            else:
+                self._stats["local_ms"] += latency_ms
+        return Decision(label, confidence, escalated, latency_ms)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        local = stats["decisions"] - stats["escalations"]
+        stats["escalation_rate"] = stats["escalations"] / stats["decisions"] if stats["decisions"] else 0.0
+        stats["avg_local_ms"] = stats["local_ms"] / local if local else 0.0
+        stats["avg_escalated_ms"] = stats["escalated_ms"] / stats["escalations"] if stats["escalations"] else 0.0
+        return stats
@@ -0,0 +1,168 @@
+# Memoized Gemini responses for the chatbot agents
+#
+# Responses are keyed on (agent, model, schema_catalog.version, prompt hash),
+# so the same question asked again, or replayed from the sidebar history, skips
+# the LLM round-trip. An in-memory LRU with a TTL sits in front of an optional
+# backend; SQLiteBackend keeps responses across restarts and is switched on
+# with LLM_CACHE_DB. Anything with get(key) / set(key, value, created_at) /
+# delete(key) can be plugged in as a backend. Generated SQL is dropped again
+# when it fails, so asking the same question again doesn't replay it.
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from utils import metrics
+
+DEFAULT_TTL_SECONDS = int(os.environ.get("LLM_CACHE_TTL_SECONDS", 24 * 60 * 60))
+DEFAULT_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 2048))
+CHARS_PER_TOKEN = 4  # Rough estimate when a response carries no usage metadata
+
+
+def model_name(model):
+    return getattr(model, "model_name", None) or type(model).__name__
+
+
+def response_key(agent, model, prompt, schema=""):
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    return f"{agent}|{model}|{schema}|{prompt_hash}"
+
+
+def record_usage(agent, prompt, text, usage=None):
+    """Count prompt / response tokens for `agent`, from Gemini's usage_metadata when present."""
+    prompt_tokens = getattr(usage, "prompt_token_count", 0) or len(prompt) // CHARS_PER_TOKEN
+    response_tokens = getattr(usage, "candidates_token_count", 0) or len(text) // CHARS_PER_TOKEN
+    metrics.add("llm_prompt_tokens", prompt_tokens, label=agent)
+    metrics.add("llm_response_tokens", response_tokens, label=agent)
+    metrics.add("llm_calls", 1, label=agent)
+
+
+class SQLiteBackend:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT, created_at REAL)"
+            )
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        return row  # (value, created_at) or None
+
+    def set(self, key, value, created_at):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at) VALUES (?, ?, ?)",
+                (key, value, created_at),
+            )
+
+    def delete(self, key):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+
+class ResponseCache:
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES, backend=None):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.backend = backend
+        self._entries = OrderedDict()   # key -> (value, created_at)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "backend_hits": 0, "misses": 0}
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None and now - item[1] > self.ttl_seconds:
+                del self._entries[key]
+                item = None
+            if item is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return item[0]
+
+        if self.backend is not None:
+            item = self.backend.get(key)
+            if item is not None and now - item[1] <= self.ttl_seconds:
+                with self._lock:
+                    self._remember(key, item[0], item[1])
+                    self._stats["backend_hits"] += 1
+                return item[0]
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def set(self, key, value):
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, value, created_at)
+        if self.backend is not None:
+            self.backend.set(key, value, created_at)
+
+    def delete(self, key):
+        """Forget `key` here and in the backend, e.g. SQL that failed to run."""
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.backend is not None:
+            self.backend.delete(key)
+
+    def generate(self, model, prompt, agent, schema=""):
+        """Text of `model.generate_content(prompt)`, from the cache when possible."""
+        key = response_key(agent, model_name(model), prompt, schema)
+        text = self.get(key)
+        if text is None:
+            response = model.generate_content(prompt)
+            text = response.text
+            record_usage(agent, prompt, text, getattr(response, "usage_metadata", None))
+            self.set(key, text)
+        return text
+
+    def stream(self, model, prompt, agent, schema=""):
+        """Like generate(), but yields the text chunk by chunk. A cached response
+        comes back as a single chunk; a fresh one is cached once it is complete."""
+        key = response_key(agent, model_name(model), prompt, schema)
+        text = self.get(key)
+        if text is not None:
+            yield text
+            return
+        parts, usage = [], None
+        for chunk in model.generate_content(prompt, stream=True):
+            usage = getattr(chunk, "usage_metadata", None) or usage   # Complete on the last chunk
+            if chunk.text:
+                parts.append(chunk.text)
+                yield chunk.text
+        record_usage(agent, prompt, "".join(parts), usage)
+        self.set(key, "".join(parts))
+
+    def clear(self):
+        """Forget the in-memory entries (the backend, if any, is left alone)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+    def _remember(self, key, value, created_at):
+        # Caller holds self._lock
+        self._entries[key] = (value, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+def _default_backend():
+    path = os.environ.get("LLM_CACHE_DB")
+    return SQLiteBackend(path) if path else None
+
+
+# One cache for the whole server process
+llm_cache = ResponseCache(backend=_default_backend())
@@ -0,0 +1,202 @@
+# Local DuckDB engine for queries on the one sales table
+#
+# Almost every generated query is a small aggregate over
+# transaction_summary_with_sales, yet each one pays BigQuery's job start-up
+# time. With LOCAL_ENGINE_DIR set (and duckdb installed), the table is copied
+# to a Parquet file there with list_rows, which reads through the Storage API
+# and is not billed as a query. The copy is refreshed in the background once
+# it is older than LOCAL_ENGINE_MAX_AGE_SECONDS. SQL that only reads that
+# table is translated from the BigQuery dialect and runs in DuckDB. Anything
+# else, anything the translation doesn't cover, and any DuckDB error return
+# None so the caller falls back to BigQuery. Only one SELECT / WITH statement
+# is accepted, and the copy is loaded into an in-memory table before file and
+# network access is switched off and the configuration locked, so generated
+# SQL can't read or write files on the server.
+
+import os
+import re
+import threading
+import time
+
+import pyarrow.parquet as pq
+
+from utils.result_download import download_arrow
+from utils.schema_catalog import TABLE_ID
+
+try:
+    import duckdb
+except ImportError:  # Optional: without duckdb every query goes to BigQuery
+    duckdb = None
+
+LOCAL_ENGINE_DIR = os.environ.get("LOCAL_ENGINE_DIR") or None
+MAX_AGE_SECONDS = int(os.environ.get("LOCAL_ENGINE_MAX_AGE_SECONDS", 60 * 60))
+
+_TABLE_REF = re.compile(r"\b(from|join)\s+(`[^`]+`|[\w.-]+)", re.IGNORECASE)
+_EXTRACT = re.compile(r"\bextract\s*\([^()]*\)", re.IGNORECASE)   # EXTRACT(YEAR FROM d) is not a table
+_WRITE = re.compile(
+    r"\b(insert|update|delete|merge|create|drop|alter|truncate|grant|export|import|call|declare|copy|attach|detach|"
+    r"install|load|pragma|set|reset|use|checkpoint|vacuum)\b",
+    re.IGNORECASE,
+)
+_STATEMENT = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+# BigQuery-only features with no DuckDB translation here
+_UNSUPPORTED = re.compile(
+    r"\b(ml\.\w+|external_query|for\s+system_time|_table_suffix|_partitiontime|approx_top_count|st_\w+|"
+    r"parse_date|parse_timestamp|regexp_extract_all|generate_date_array|array_agg\s*\(\s*struct)\b",
+    re.IGNORECASE,
+)
+
+# (pattern, replacement) pairs applied in order
+_TRANSLATIONS = [
+    (re.compile(r"\bcurrent_(date|timestamp)\s*\(\s*\)", re.IGNORECASE), r"current_\1"),
+    (re.compile(r"\bsafe_cast\s*\(", re.IGNORECASE), "try_cast("),
+    (re.compile(r"\bint64\b", re.IGNORECASE), "BIGINT"),
+    (re.compile(r"\bfloat64\b", re.IGNORECASE), "DOUBLE"),
+    (re.compile(r"\bnumeric\b", re.IGNORECASE), "DECIMAL(38, 9)"),
+    (re.compile(r"\bbool\b", re.IGNORECASE), "BOOLEAN"),
+    (re.compile(r"\bas\s+string\b", re.IGNORECASE), "AS VARCHAR"),
+    # DATE_SUB(d, INTERVAL n DAY) -> (d - INTERVAL n DAY); DuckDB's date_sub means something else
+    (re.compile(r"\bdate_(sub|add)\s*\(\s*([^,()]+(?:\(\))?)\s*,\s*interval\s+(-?\d+)\s+(\w+)\s*\)", re.IGNORECASE),
+     lambda m: f"({m.group(2)} {'-' if m.group(1).lower() == 'sub' else '+'} INTERVAL {m.group(3)} {m.group(4)})"),
+    # DATE_TRUNC(d, MONTH) -> date_trunc('month', d)
+    (re.compile(r"\bdate_trunc\s*\(\s*([^,()]+)\s*,\s*(\w+)\s*\)", re.IGNORECASE),
+     lambda m: f"date_trunc('{m.group(2).lower()}', {m.group(1)})"),
+    # FORMAT_DATE('%Y-%m', d) -> strftime(d, '%Y-%m')
+    (re.compile(r"\bformat_(?:date|timestamp|datetime)\s*\(\s*('[^']*')\s*,\s*([^()]+?(?:\([^()]*\))?)\s*\)", re.IGNORECASE),
+     r"strftime(\2, \1)"),
+]
+
+# BigQuery functions DuckDB lacks under the same name
+BIGQUERY_MACROS = [
+    "CREATE OR REPLACE MACRO safe_divide(a, b) AS CASE WHEN b = 0 THEN NULL ELSE a / b END",
+    "CREATE OR REPLACE MACRO countif(x) AS count_if(x)",
+]
+# Run last on every connection that executes generated SQL: BigQuery's NULL
+# ordering, then no file / network access and no way to turn it back on
+LOCKDOWN_SETTINGS = [
+    "SET default_null_order = 'nulls_first_on_asc_last_on_desc'",
+    "SET enable_external_access = false",
+    "SET lock_configuration = true",
+]
+
+
+def bigquery_connection(setup=()):
+    """DuckDB connection with the BigQuery macros, after running `setup`
+    (e.g. loading data), locked down for generated SQL."""
+    conn = duckdb.connect()
+    for statement in list(setup) + BIGQUERY_MACROS + LOCKDOWN_SETTINGS:
+        conn.execute(statement)
+    return conn
+
+
+class LocalEngine:
+    def __init__(self, table_id=TABLE_ID, directory=LOCAL_ENGINE_DIR, max_age_seconds=MAX_AGE_SECONDS):
+        self.table_id = table_id
+        self.table_name = table_id.rsplit(".", 1)[-1]
+        self.directory = directory
+        self.max_age_seconds = max_age_seconds
+        self.path = os.path.join(directory, f"{self.table_name}.parquet") if directory else None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._conn = None
+        self._loaded_mtime = None   # mtime of the Parquet copy loaded into _conn
+        self._stats = {"local": 0, "fallbacks": 0, "refreshes": 0}
+
+    @property
+    def enabled(self):
+        return duckdb is not None and self.path is not None
+
+    def age(self):
+        """Seconds since the Parquet copy was written, or None if there is none."""
+        try:
+            return time.time() - os.path.getmtime(self.path)
+        except (OSError, TypeError):
+            return None
+
+    def refresh(self, client):
+        """Copy the table to Parquet now (blocking); readers switch over atomically."""
+        os.makedirs(self.directory, exist_ok=True)
+        table = download_arrow(client.list_rows(self.table_id))
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        pq.write_table(table, tmp_path, compression="zstd")
+        os.replace(tmp_path, self.path)
+        with self._lock:
+            self._stats["refreshes"] += 1
+
+    def ensure_fresh(self, client):
+        """Refresh in a background thread when the copy is missing or older than allowed."""
+        if not self.enabled:
+            return
+        age = self.age()
+        with self._lock:
+            if (age is not None and age <= self.max_age_seconds) or self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, args=(client,), name="local-engine-refresh", daemon=True).start()
+
+    def _refresh(self, client):
+        try:
+            self.refresh(client)
+        except Exception:
+            pass  # Queries keep going to BigQuery; the next ensure_fresh() tries again
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def translate(self, sql):
+        """DuckDB SQL for `sql`, or None if it reads anything but the table or uses
+        something without a translation."""
+        if _WRITE.search(sql) or _UNSUPPORTED.search(sql):
+            return None
+        refs = _TABLE_REF.findall(_EXTRACT.sub("", sql))
+        if not refs:
+            return None
+        for _, ref in refs:
+            name = ref.strip("`")
+            if name not in (self.table_id, self.table_name) and not name.endswith(f".{self.table_name}"):
+                return None  # Another table (or a CTE name we can't tell apart); let BigQuery handle it
+
+        translated = re.sub(r"`[^`]*" + re.escape(self.table_name) + "`", self.table_name, sql)
+        translated = re.sub(r"\b[\w-]+\.[\w-]+\." + re.escape(self.table_name) + r"\b", self.table_name, translated)
+        for pattern, replacement in _TRANSLATIONS:
+            translated = pattern.sub(replacement, translated)
+        return translated.replace("`", '"')
+
+    def try_query(self, sql):
+        """Arrow table for `sql` from the local copy, or None to use BigQuery instead."""
+        if not self.enabled or self.age() is None or self.age() > self.max_age_seconds:
+            return None
+        translated = self.translate(sql)
+        if translated is None:
+            self._count("fallbacks")
+            return None
+        try:
+            table = self._cursor().execute(translated).fetch_arrow_table()
+        except duckdb.Error:
+            self._count("fallbacks")
+            return None
+        self._count("local")
+        return table
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, age_seconds=self.age())
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _cursor(self):
+        # One locked-down in-memory database holding the current copy; each query gets its own
+        # cursor. A refreshed copy is loaded into a new database, queries on the old one finish
+        mtime = os.path.getmtime(self.path)
+        with self._lock:
+            if self._conn is None or self._loaded_mtime != mtime:
+                path = self.path.replace("'", "''")
+                load = f"CREATE TABLE {self.table_name} AS SELECT * FROM read_parquet('{path}')"
+                self._conn = bigquery_connection([load])
+                self._loaded_mtime = mtime
+            return self._conn.cursor()
+
+
+local_engine = LocalEngine()
@@ -0,0 +1,169 @@
+# Latency and volume metrics for the chat pipeline
+#
+# span() times one stage of a turn (routing, SQL generation, BigQuery wait,
+# download, answer, chart, ...). Durations go into a Prometheus-style bucketed
+# histogram plus a window of recent samples for p50 / p95. add() keeps
+# counters such as prompt / response tokens and bytes processed. Everything is
+# process-wide and in memory. prometheus_text() renders it for scraping. With
+# METRICS_LOG each sample is also appended to a JSONL file, and with
+# METRICS_PORT a small HTTP server exposes /metrics.
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds, as in Prometheus client defaults (plus a few slow LLM buckets)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+RECENT_SAMPLES = int(os.environ.get("METRICS_RECENT_SAMPLES", 1000))
+LOG_PATH = os.environ.get("METRICS_LOG") or None
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))
+
+_lock = threading.Lock()
+_histograms = {}   # stage -> {"buckets": [...], "count", "sum", "recent": deque}
+_counters = {}     # (name, label) -> value
+
+
+def _quantile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _log(record):
+    if LOG_PATH:
+        with open(LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+def observe(stage, seconds, **attrs):
+    """Record one duration for `stage`; extra attributes only go to the JSONL log."""
+    with _lock:
+        histogram = _histograms.get(stage)
+        if histogram is None:
+            histogram = _histograms[stage] = {"buckets": [0] * len(BUCKETS), "count": 0, "sum": 0.0,
+                                              "recent": deque(maxlen=RECENT_SAMPLES)}
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram["buckets"][i] += 1
+        histogram["count"] += 1
+        histogram["sum"] += seconds
+        histogram["recent"].append(seconds)
+        if LOG_PATH:
+            _log(dict(attrs, type="span", stage=stage, seconds=round(seconds, 6), ts=time.time()))
+
+
+def add(name, value, label=""):
+    """Increase counter `name` (optionally per `label`, e.g. the agent) by `value`."""
+    if not value:
+        return
+    with _lock:
+        _counters[(name, label)] = _counters.get((name, label), 0) + value
+        if LOG_PATH:
+            _log({"type": "counter", "name": name, "label": label, "value": value, "ts": time.time()})
+
+
+@contextmanager
+def span(stage, **attrs):
+    """Time the body as one `stage` sample, whether it returns or raises."""
+    started = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        if error:
+            attrs["error"] = error
+        observe(stage, time.perf_counter() - started, **attrs)
+
+
+def stage_summary():
+    """count / p50 / p95 / max / mean in milliseconds per stage, slowest p95 first."""
+    with _lock:
+        items = [(stage, h["count"], h["sum"], sorted(h["recent"])) for stage, h in _histograms.items()]
+    rows = []
+    for stage, count, total, recent in items:
+        rows.append({
+            "stage": stage,
+            "count": count,
+            "p50_ms": _quantile(recent, 0.50) * 1000,
+            "p95_ms": _quantile(recent, 0.95) * 1000,
+            "max_ms": (recent[-1] if recent else 0.0) * 1000,
+            "mean_ms": total / count * 1000 if count else 0.0,
+        })
+    rows.sort(key=lambda r: r["p95_ms"], reverse=True)
+    return rows
+
+
+def counters():
+    with _lock:
+        return {f"{name}{{{label}}}" if label else name: value for (name, label), value in sorted(_counters.items())}
+
+
+def prometheus_text(prefix="chatbot"):
+    """All histograms and counters in the Prometheus text exposition format."""
+    with _lock:
+        histograms = {stage: (list(h["buckets"]), h["count"], h["sum"]) for stage, h in _histograms.items()}
+        counter_items = sorted(_counters.items())
+
+    lines = [f"# TYPE {prefix}_stage_seconds histogram"]
+    for stage, (buckets, count, total) in sorted(histograms.items()):
+        for bound, value in zip(BUCKETS, buckets):
+            lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {value}')
+        lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+        lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {total}')
+        lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {count}')
+
+    declared = set()
+    for (name, label), value in counter_items:
+        if name not in declared:
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            declared.add(name)
+        labels = f'{{label="{label}"}}' if label else ""
+        lines.append(f"{prefix}_{name}_total{labels} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass  # Scrapes every few seconds would flood the Streamlit log
+
+
+_server = None
+
+
+def serve_metrics(port=METRICS_PORT):
+    """Expose /metrics on `port` from a daemon thread (once per process)."""
+    global _server
+    with _lock:
+        if _server is None:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    return _server
+
+
+if METRICS_PORT:
+    serve_metrics()
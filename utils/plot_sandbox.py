@@ -0,0 +1,147 @@
+# Sandboxed execution of LLM-generated plot code
+#
+# Generated code never runs inside the Streamlit server process. A small pool
+# of worker processes is started up front (from a forkserver, so they don't
+# inherit the server's threads), each with a memory limit and a per-task
+# CPU-time limit. The DataFrame goes to a worker as an Arrow IPC stream and
+# only the figure's JSON comes back. A worker that hits the wall-clock timeout
+# is killed and replaced, so a looping snippet can't stall other sessions.
+
+import math
+import multiprocessing
+import os
+import queue
+import threading
+
+import pyarrow as pa
+
+from utils import metrics
+
+POOL_SIZE = int(os.environ.get("PLOT_SANDBOX_WORKERS", 2))
+CPU_SECONDS = int(os.environ.get("PLOT_SANDBOX_CPU_SECONDS", 5))
+MEMORY_BYTES = int(os.environ.get("PLOT_SANDBOX_MEMORY_BYTES", 2 * 1024 ** 3))
+TIMEOUT_SECONDS = float(os.environ.get("PLOT_SANDBOX_TIMEOUT_SECONDS", 10))
+
+
+class SandboxError(Exception):
+    pass
+
+
+class SandboxTimeout(SandboxError):
+    pass
+
+
+def _worker_main(conn, cpu_seconds, memory_bytes):
+    import resource
+
+    import pandas as pd
+    import plotly.express as px
+
+    # Imports first: the memory limit is for the generated code, not for loading libraries
+    resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    _, cpu_hard = resource.getrlimit(resource.RLIMIT_CPU)
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        code, payload = message
+
+        # RLIMIT_CPU counts the whole process, so move the soft limit forward per task;
+        # going over it kills the worker with SIGXCPU
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        used = math.ceil(usage.ru_utime + usage.ru_stime)
+        resource.setrlimit(resource.RLIMIT_CPU, (used + cpu_seconds, cpu_hard))
+
+        try:
+            df = pa.ipc.open_stream(payload).read_all().to_pandas()
+            local_scope = {}
+            exec(code, {"df": df, "pd": pd, "px": px}, local_scope)
+            fig = local_scope.get("fig")
+            conn.send(("ok", fig.to_json() if fig is not None else None))
+        except MemoryError:
+            conn.send(("error", "the plot code ran out of memory"))
+        except BaseException as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+def _to_ipc(df):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+class PlotSandbox:
+    def __init__(self, size=POOL_SIZE, cpu_seconds=CPU_SECONDS, memory_bytes=MEMORY_BYTES,
+                 timeout=TIMEOUT_SECONDS):
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+        self.timeout = timeout
+        self._context = multiprocessing.get_context("forkserver")
+        self._idle = queue.Queue()
+        for _ in range(size):
+            self._idle.put(self._start_worker())
+
+    def _start_worker(self):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main, args=(child_conn, self.cpu_seconds, self.memory_bytes),
+            name="plot-sandbox", daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        return process, parent_conn
+
+    def _replace(self, worker):
+        process, conn = worker
+        process.kill()
+        process.join(timeout=1)
+        conn.close()
+        self._idle.put(self._start_worker())
+
+    def run(self, code, df):
+        """Execute `code` with `df` in a worker; returns the figure JSON (or None
+        if the code made no `fig`). Raises SandboxError / SandboxTimeout."""
+        with metrics.span("plot_sandbox"):
+            return self._run(code, _to_ipc(df))
+
+    def _run(self, code, payload):
+        try:
+            worker = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise SandboxTimeout("All plot workers are busy, try again in a moment.")
+
+        process, conn = worker
+        try:
+            conn.send((code, payload))
+            if not conn.poll(self.timeout):
+                self._replace(worker)
+                raise SandboxTimeout(f"The plot code took longer than {self.timeout:g} seconds and was stopped.")
+            status, value = conn.recv()
+        except (EOFError, OSError):
+            # The worker died: CPU limit (SIGXCPU), memory, or a crash in native code
+            self._replace(worker)
+            raise SandboxError("The plot code was stopped for using too much CPU or memory.")
+
+        self._idle.put(worker)
+        if status != "ok":
+            raise SandboxError(value)
+        return value
+
+
+_sandbox = None
+_sandbox_lock = threading.Lock()
+
+
+def get_plot_sandbox():
+    """The process-wide sandbox, started on first use."""
+    global _sandbox
+    with _sandbox_lock:
+        if _sandbox is None:
+            _sandbox = PlotSandbox()
+        return _sandbox
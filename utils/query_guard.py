@@ -0,0 +1,112 @@
+# Cost and latency guard for generated SQL
+#
+# Before a generated query runs it is dry-run to learn how many bytes it would
+# scan. Queries over the budget are narrowed to recent partitions when that is
+# configured, or rejected otherwise. Queries without a LIMIT get one, and the
+# real job carries maximum_bytes_billed and a timeout, so BigQuery enforces the
+# same limits server-side. Only client.query() and the job's
+# total_bytes_processed / result() / cancel() are used, so a fake client works
+# for tests and benchmarks.
+
+import copy
+import os
+import re
+from collections import namedtuple
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from google.cloud import bigquery
+
+MAX_BYTES_BILLED = int(os.environ.get("QUERY_MAX_BYTES_BILLED", 10 * 1024 ** 3))
+MAX_RESULT_ROWS = int(os.environ.get("QUERY_MAX_ROWS", 10000))
+JOB_TIMEOUT_SECONDS = int(os.environ.get("QUERY_TIMEOUT_SECONDS", 120))
+
+# Optional: narrow over-budget queries to the last N days of this DATE column
+PARTITION_COLUMN = os.environ.get("QUERY_PARTITION_COLUMN") or None
+PARTITION_DAYS = int(os.environ.get("QUERY_PARTITION_DAYS", 90))
+
+GuardedQuery = namedtuple("GuardedQuery", ["sql", "job_config", "estimated_bytes", "timeout", "notes"])
+
+_TRAILING_LIMIT = re.compile(r"\blimit\s+\d+(\s+offset\s+\d+)?\s*$", re.IGNORECASE)
+_TABLE_REF = re.compile(r"\b(from|join)\s+(`[^`]+`|[\w.-]+\.[\w-]+\.[\w-]+)", re.IGNORECASE)
+
+
+class QueryRejected(Exception):
+    pass
+
+
+class QueryTimeout(Exception):
+    pass
+
+
+def format_bytes(num_bytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if num_bytes < 1024:
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} TB"
+
+
+def dry_run(client, sql):
+    """Bytes `sql` would scan; raises the BigQuery error if the SQL is invalid."""
+    config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+    return client.query(sql, job_config=config).total_bytes_processed or 0
+
+
+def row_cap_note(max_rows):
+    return f"capped at {max_rows} rows"
+
+
+def add_row_limit(sql, max_rows):
+    if _TRAILING_LIMIT.search(sql):
+        return sql
+    return f"{sql}\nLIMIT {max_rows}"
+
+
+def restrict_to_recent_partitions(sql, column, days):
+    """Replace every table reference with a subquery over the last `days` days."""
+    def narrow(match):
+        keyword, table = match.groups()
+        table = table if table.startswith("`") else f"`{table}`"
+        return (f"{keyword} (SELECT * FROM {table} "
+                f"WHERE {column} >= DATE_SUB(CURRENT_DATE(), INTERVAL {days} DAY))")
+    return _TABLE_REF.sub(narrow, sql)
+
+
+def guard_query(client, sql, job_config=None, max_bytes=MAX_BYTES_BILLED, max_rows=MAX_RESULT_ROWS,
+                timeout=JOB_TIMEOUT_SECONDS):
+    """Dry-run `sql` and return a GuardedQuery that is safe to execute, or raise
+    QueryRejected if it would scan more than `max_bytes`."""
+    sql = sql.strip().rstrip(";").strip()
+    notes = []
+    estimated = dry_run(client, sql)
+
+    if estimated > max_bytes and PARTITION_COLUMN:
+        narrowed = restrict_to_recent_partitions(sql, PARTITION_COLUMN, PARTITION_DAYS)
+        narrowed_bytes = dry_run(client, narrowed)
+        if narrowed_bytes < estimated:
+            notes.append(f"limited to the last {PARTITION_DAYS} days of {PARTITION_COLUMN}")
+            sql, estimated = narrowed, narrowed_bytes
+
+    if estimated > max_bytes:
+        raise QueryRejected(
+            f"This query would scan {format_bytes(estimated)}, more than the "
+            f"{format_bytes(max_bytes)} limit. Try asking for fewer columns or a narrower date range."
+        )
+
+    limited = add_row_limit(sql, max_rows)
+    if limited != sql:
+        notes.append(row_cap_note(max_rows))
+
+    config = copy.deepcopy(job_config) if job_config is not None else bigquery.QueryJobConfig()
+    config.maximum_bytes_billed = max_bytes
+    config.job_timeout_ms = timeout * 1000
+    return GuardedQuery(limited, config, estimated, timeout, notes)
+
+
+def wait_for_result(query_job, timeout):
+    """query_job.result() with a deadline; the job is cancelled when it runs over."""
+    try:
+        return query_job.result(timeout=timeout)
+    except (TimeoutError, FutureTimeoutError):
+        query_job.cancel()
+        raise QueryTimeout(f"Query did not finish within {timeout} seconds and was cancelled.")
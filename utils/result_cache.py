@@ -0,0 +1,280 @@
+# Query result cache shared by every session in the server process
+#
+# Results are keyed on the normalized SQL text and kept as Parquet bytes, which
+# are a lot smaller than the Arrow tables they came from. Entries expire after a
+# TTL and the least recently used ones are dropped once the memory budget is
+# used up. If RESULT_CACHE_DIR is set, entries are also written to disk so they
+# survive a restart. Entries are namespaced by the service account that ran
+# them, and the rollups and the local engine only answer for a service account
+# whose BigQuery query succeeded within CREDENTIAL_CHECK_SECONDS, so nobody
+# reads results their own key couldn't.
+
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import pyarrow.parquet as pq
+
+from utils import metrics
+
+from utils.bigquery_client import credential_namespace
+from utils.local_engine import local_engine
+from utils.query_guard import MAX_RESULT_ROWS, add_row_limit, guard_query, row_cap_note, wait_for_result
+from utils.result_download import QueryResult, download_arrow
+from utils.rollups import rollup_store
+
+DEFAULT_TTL_SECONDS = int(os.environ.get("RESULT_CACHE_TTL_SECONDS", 15 * 60))
+DEFAULT_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+DEFAULT_DISK_DIR = os.environ.get("RESULT_CACHE_DIR") or None
+CREDENTIAL_CHECK_SECONDS = int(os.environ.get("CREDENTIAL_CHECK_SECONDS", 15 * 60))
+
+# Quoted strings / identifiers are kept as they are, everything else gets its whitespace collapsed
+_SQL_TOKENS = re.compile(r"('(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`)|(\s+)")
+
+
+def normalize_sql(sql):
+    """Canonical form of a query used as the cache key."""
+    sql = sql.strip()
+    if sql.startswith("```"):
+        sql = sql.strip("`").strip()
+        if sql.lower().startswith("sql"):
+            sql = sql[3:]
+    sql = _SQL_TOKENS.sub(lambda m: m.group(1) or " ", sql).strip()
+    return sql.rstrip(";").strip()
+
+
+def cache_key(sql, namespace=""):
+    return hashlib.sha256(f"{namespace}\n{normalize_sql(sql)}".encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS, max_bytes=DEFAULT_MAX_BYTES, disk_dir=DEFAULT_DISK_DIR):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()   # key -> (payload, meta)
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "bytes_processed_saved": 0,
+            "seconds_saved": 0.0,
+        }
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    # -- public API -------------------------------------------------------
+
+    def get(self, sql, namespace=""):
+        key = cache_key(sql, namespace)
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None and self._expired(item[1]):
+                self._drop(key)
+                item = None
+            if item is not None:
+                self._entries.move_to_end(key)
+                self._record_hit(item[1], "hits")
+        if item is None and self.disk_dir:
+            item = self._read_disk(key)
+            if item is not None:
+                with self._lock:
+                    self._store(key, *item)
+                    self._record_hit(item[1], "disk_hits")
+        if item is None:
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+
+        payload, meta = item
+        table = pq.read_table(io.BytesIO(payload))
+        return QueryResult(table, meta["job_id"], meta["bytes_processed"], meta["elapsed_seconds"], from_cache=True,
+                           notes=meta.get("notes", ()))
+
+    def put(self, sql, table, job_id=None, bytes_processed=0, elapsed_seconds=0.0, namespace="", notes=()):
+        key = cache_key(sql, namespace)
+        buffer = io.BytesIO()
+        pq.write_table(table, buffer, compression="zstd")
+        payload = buffer.getvalue()
+        meta = {
+            "created_at": time.time(),
+            "job_id": job_id,
+            "bytes_processed": bytes_processed or 0,
+            "elapsed_seconds": elapsed_seconds,
+            "notes": list(notes),
+        }
+        if len(payload) > self.max_bytes:
+            return  # Would evict everything else and still not fit
+        with self._lock:
+            self._store(key, payload, meta)
+        if self.disk_dir:
+            self._write_disk(key, payload, meta)
+
+    def invalidate(self, sql, namespace=""):
+        key = cache_key(sql, namespace)
+        with self._lock:
+            self._drop(key)
+        if self.disk_dir:
+            for path in self._disk_paths(key):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._size
+        lookups = stats["hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    # -- internals (callers hold self._lock) -------------------------------
+
+    def _expired(self, meta):
+        return time.time() - meta["created_at"] > self.ttl_seconds
+
+    def _record_hit(self, meta, counter):
+        self._stats[counter] += 1
+        self._stats["bytes_processed_saved"] += meta["bytes_processed"]
+        self._stats["seconds_saved"] += meta["elapsed_seconds"]
+
+    def _store(self, key, payload, meta):
+        self._drop(key)
+        self._entries[key] = (payload, meta)
+        self._size += len(payload)
+        while self._size > self.max_bytes and self._entries:
+            old_key, (old_payload, _) = self._entries.popitem(last=False)
+            self._size -= len(old_payload)
+            self._stats["evictions"] += 1
+
+    def _drop(self, key):
+        item = self._entries.pop(key, None)
+        if item is not None:
+            self._size -= len(item[0])
+
+    # -- disk tier ------------------------------------------------------------
+
+    def _disk_paths(self, key):
+        return os.path.join(self.disk_dir, f"{key}.parquet"), os.path.join(self.disk_dir, f"{key}.json")
+
+    def _read_disk(self, key):
+        data_path, meta_path = self._disk_paths(key)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if self._expired(meta):
+                os.remove(data_path)
+                os.remove(meta_path)
+                return None
+            with open(data_path, "rb") as f:
+                return f.read(), meta
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key, payload, meta):
+        data_path, meta_path = self._disk_paths(key)
+        try:
+            # Write the data first so a reader never sees metadata without it
+            with open(data_path + ".tmp", "wb") as f:
+                f.write(payload)
+            os.replace(data_path + ".tmp", data_path)
+            with open(meta_path + ".tmp", "w") as f:
+                json.dump(meta, f)
+            os.replace(meta_path + ".tmp", meta_path)
+        except OSError:
+            pass  # The disk tier is best effort
+
+
+# One cache for the whole server process
+result_cache = ResultCache()
+
+
+def result_notes(notes, table):
+    # The row cap is only worth mentioning when the result actually reached it
+    cap = row_cap_note(MAX_RESULT_ROWS)
+    return [note for note in notes if note != cap or table.num_rows >= MAX_RESULT_ROWS]
+
+
+_checked = {}       # credential namespace -> when a BigQuery query last succeeded with it
+_checked_lock = threading.Lock()
+
+
+def _credential_checked(namespace):
+    with _checked_lock:
+        checked_at = _checked.get(namespace)
+    return checked_at is not None and time.monotonic() - checked_at <= CREDENTIAL_CHECK_SECONDS
+
+
+def _mark_checked(namespace):
+    with _checked_lock:
+        _checked[namespace] = time.monotonic()
+
+
+def run_cached_query(client, sql, job_config=None, guard=True, guarded=None):
+    """Run `sql` through the shared cache, only hitting BigQuery on a miss.
+    With `guard`, the query is dry-run and budgeted first (see query_guard);
+    pass `guarded` when that was already done for this SQL."""
+    namespace = credential_namespace(client)
+    cached = result_cache.get(sql, namespace=namespace)
+    if cached is not None:
+        return cached
+
+    started = time.perf_counter()
+    # The local copies skip BigQuery's access checks; a key BigQuery hasn't accepted lately can't use them
+    checked = _credential_checked(namespace)
+    if checked and rollup_store.enabled:
+        # Group-bys over the common dimensions come straight from the precomputed rollups
+        rollup_store.ensure_fresh(client)
+        with metrics.span("rollups"):
+            table = rollup_store.try_query(normalize_sql(sql))
+        if table is not None:
+            elapsed = time.perf_counter() - started
+            result_cache.put(sql, table, "rollup", 0, elapsed, namespace=namespace)
+            return QueryResult(table, "rollup", 0, elapsed)
+
+    if checked and local_engine.enabled:
+        # Single-table queries run on the local Parquet copy when it is fresh enough
+        local_engine.ensure_fresh(client)
+        local_sql = normalize_sql(sql).rstrip(";")
+        limited = add_row_limit(local_sql, MAX_RESULT_ROWS)
+        with metrics.span("local_engine"):
+            table = local_engine.try_query(limited)
+        if table is not None:
+            elapsed = time.perf_counter() - started
+            notes = result_notes([row_cap_note(MAX_RESULT_ROWS)] if limited != local_sql else [], table)
+            result_cache.put(sql, table, "local", 0, elapsed, namespace=namespace, notes=notes)
+            return QueryResult(table, "local", 0, elapsed, notes=notes)
+
+    sql_to_run, timeout, notes = normalize_sql(sql), None, []
+    if guard or guarded is not None:
+        if guarded is None:
+            with metrics.span("bigquery_dry_run"):
+                guarded = guard_query(client, sql_to_run, job_config)
+        sql_to_run, job_config, timeout, notes = guarded.sql, guarded.job_config, guarded.timeout, guarded.notes
+    query_job = client.query(sql_to_run, job_config=job_config)
+    with metrics.span("bigquery_wait"):
+        rows = wait_for_result(query_job, timeout)
+    with metrics.span("bigquery_download"):
+        table = download_arrow(rows)
+    elapsed = time.perf_counter() - started
+    metrics.add("bigquery_bytes_processed", query_job.total_bytes_processed or 0)
+    metrics.add("bigquery_jobs", 1)
+    _mark_checked(namespace)
+
+    notes = result_notes(notes, table)
+    result_cache.put(sql, table, query_job.job_id, query_job.total_bytes_processed, elapsed, namespace=namespace,
+                     notes=notes)
+    return QueryResult(table, query_job.job_id, query_job.total_bytes_processed, elapsed, notes=notes)
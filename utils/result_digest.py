@@ -0,0 +1,99 @@
+# Bounded-size summary of a query result for LLM prompts
+#
+# Interpolating a whole DataFrame into a prompt makes the prompt grow with the
+# result. digest_dataframe() describes the result instead: shape, schema,
+# per-column statistics, the most frequent values of text columns and a few
+# sample rows. All of it is cut down until it fits the token budget. Small
+# results are included in full so answers about them stay exact.
+
+import os
+
+import pandas as pd
+
+DEFAULT_TOKEN_BUDGET = int(os.environ.get("RESULT_DIGEST_TOKEN_BUDGET", 1000))
+CHARS_PER_TOKEN = 4             # Rough estimate, good enough for budgeting
+FULL_RESULT_ROWS = 20           # Results this small are sent as they are
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _numeric_stats(df):
+    numeric = df.select_dtypes(include="number")
+    if numeric.empty:
+        return ""
+    stats = numeric.agg(["min", "max", "mean", "std", "sum"]).T
+    stats.insert(0, "nulls", numeric.isna().sum())
+    return stats.to_string(float_format=lambda v: f"{v:.4g}")
+
+
+def _top_values(df, top_k):
+    lines = []
+    for name in df.columns:
+        column = df[name]
+        if pd.api.types.is_numeric_dtype(column) or pd.api.types.is_datetime64_any_dtype(column):
+            continue
+        counts = column.astype("string").value_counts(dropna=True).head(top_k)
+        values = ", ".join(f"{value} ({count})" for value, count in counts.items())
+        lines.append(f"- {name}: {column.nunique(dropna=True)} distinct; top: {values}")
+    return "\n".join(lines)
+
+
+def _date_ranges(df):
+    lines = []
+    for name in df.select_dtypes(include=["datetime", "datetimetz"]).columns:
+        lines.append(f"- {name}: {df[name].min()} to {df[name].max()}")
+    # BigQuery DATE columns come back as object / dbdate, try those too
+    for name in df.select_dtypes(include=["object"]).columns:
+        sample = df[name].dropna().head(1)
+        if len(sample) and hasattr(sample.iloc[0], "isoformat"):
+            values = df[name].dropna()
+            lines.append(f"- {name}: {values.min()} to {values.max()}")
+    return "\n".join(lines)
+
+
+def _render(df, head_rows, top_k):
+    schema = ", ".join(f"{name} ({dtype})" for name, dtype in df.dtypes.items())
+    parts = [f"Rows: {len(df)}, Columns: {len(df.columns)}", f"Schema: {schema}"]
+
+    if len(df) <= head_rows:
+        parts.append("All rows:\n" + df.to_string(index=False))
+        return "\n\n".join(parts)
+
+    numeric = _numeric_stats(df)
+    if numeric:
+        parts.append("Numeric columns:\n" + numeric)
+    dates = _date_ranges(df)
+    if dates:
+        parts.append("Date ranges:\n" + dates)
+    if top_k:
+        top = _top_values(df, top_k)
+        if top:
+            parts.append("Text columns:\n" + top)
+    if head_rows:
+        parts.append(f"First {head_rows} rows:\n" + df.head(head_rows).to_string(index=False))
+    return "\n\n".join(parts)
+
+
+def digest_dataframe(df, token_budget=DEFAULT_TOKEN_BUDGET):
+    """Text summary of `df` that stays within roughly `token_budget` tokens."""
+    if df is None:
+        return "The query returned no result."
+    if df.empty:
+        return f"The query returned no rows. Columns: {', '.join(map(str, df.columns))}"
+
+    head_rows, top_k = FULL_RESULT_ROWS, 5
+    text = _render(df, head_rows, top_k)
+    # Give up detail step by step until the digest fits
+    while estimate_tokens(text) > token_budget and (head_rows or top_k):
+        if head_rows:
+            head_rows = head_rows // 2
+        else:
+            top_k -= 1
+        text = _render(df, head_rows, top_k)
+
+    max_chars = token_budget * CHARS_PER_TOKEN
+    if len(text) > max_chars:
+        text = text[:max_chars] + "\n[truncated]"
+    return text
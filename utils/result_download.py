@@ -0,0 +1,104 @@
+# Columnar download path for query results
+#
+# Large results are pulled through the BigQuery Storage Read API as Arrow
+# record batches instead of paging JSON rows over REST. The Arrow table is
+# kept as it is; pandas only sees it when something asks for .df (converted
+# with Arrow-backed dtypes, so mostly without copying). The result viewer
+# converts just the page it shows.
+
+import os
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from utils import metrics
+
+# Below this many rows the REST download is as fast and skips opening a read session
+STORAGE_API_MIN_ROWS = int(os.environ.get("STORAGE_API_MIN_ROWS", 5000))
+
+
+def download_arrow(row_iterator):
+    """Arrow table for a finished query's rows, using the Storage API for large results."""
+    use_storage_api = (row_iterator.total_rows or 0) >= STORAGE_API_MIN_ROWS
+    # Falls back to REST on its own if google-cloud-bigquery-storage isn't installed
+    return row_iterator.to_arrow(create_bqstorage_client=use_storage_api)
+
+
+def arrow_to_pandas(table):
+    with metrics.span("to_dataframe", rows=table.num_rows):
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+class QueryResult:
+    def __init__(self, table, job_id=None, bytes_processed=0, elapsed_seconds=0.0, from_cache=False, notes=()):
+        self.table = table
+        self.job_id = job_id
+        self.bytes_processed = bytes_processed or 0
+        self.elapsed_seconds = elapsed_seconds
+        self.from_cache = from_cache
+        self.notes = list(notes)    # What the query guard changed, e.g. a row cap; shown with the result
+        self._df = None
+        self._view_key, self._view = None, None
+        # session_memory may offload / release this result from another session's thread;
+        # hold the lock while reading `table` more than once (see show_result_page)
+        self.lock = threading.RLock()
+
+    @property
+    def num_rows(self):
+        return self.table.num_rows
+
+    @property
+    def df(self):
+        """The whole result as a DataFrame, converted on first use."""
+        with self.lock:
+            if self._df is None:
+                self._df = arrow_to_pandas(self.table)
+            return self._df
+
+    def view(self, sort_by=None, descending=False, filter_column=None, filter_text=""):
+        """Sorted / filtered Arrow table, computed with pyarrow and memoized for the
+        last settings so paging through it doesn't redo the work."""
+        key = (sort_by, descending, filter_column, filter_text)
+        with self.lock:
+            if self._view_key != key:
+                table = self.table
+                if filter_column and filter_text:
+                    values = pc.cast(table[filter_column], pa.string())
+                    mask = pc.match_substring(values, filter_text, ignore_case=True)
+                    table = table.filter(pc.fill_null(mask, False))
+                if sort_by:
+                    order = "descending" if descending else "ascending"
+                    table = table.take(pc.sort_indices(table, sort_keys=[(sort_by, order)]))
+                self._view_key, self._view = key, table
+            return self._view
+
+    # -- memory management (see session_memory) -------------------------------
+
+    @property
+    def released(self):
+        return self.table is None
+
+    def nbytes(self):
+        with self.lock:
+            if self.table is None:
+                return 0
+            total = self.table.nbytes
+            if self._df is not None:
+                total += int(self._df.memory_usage(deep=True).sum())
+            if self._view is not None and self._view is not self.table:
+                total += self._view.nbytes
+            return total
+
+    def offload(self):
+        """Drop everything derived from the Arrow table; it is rebuilt on demand."""
+        with self.lock:
+            self._df = None
+            self._view_key, self._view = None, None
+
+    def release(self):
+        """Drop the data itself. Callers check `released` and fetch the result again."""
+        with self.lock:
+            self.offload()
+            self.table = None
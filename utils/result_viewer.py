@@ -0,0 +1,66 @@
+# Paginated result table for Streamlit
+#
+# Only the visible page of a QueryResult is converted to pandas and sent to the
+# browser. Sorting and filtering run on the Arrow table on the server, so the
+# websocket payload stays the size of one page whatever the result size is.
+
+import math
+
+import pandas as pd
+import streamlit as st
+
+PAGE_SIZES = (25, 50, 100, 250)
+NO_COLUMN = "(none)"
+
+
+def show_result_page(result, key):
+    """Render one page of `result` with sort / filter / paging controls.
+    `key` keeps the widgets of different tables apart."""
+    # Memory pressure in another session can release the result; the lock keeps it until drawn
+    with result.lock:
+        if result.released:
+            st.caption("This result was released to save memory; ask again to reload it.")
+            return
+        _show_page(result, key)
+
+
+def _show_page(result, key):
+    names = list(result.table.column_names)
+
+    sort_col, order_col, filter_col, text_col = st.columns(4)
+    sort_by = sort_col.selectbox("Sort by", [NO_COLUMN] + names, key=f"{key}_sort")
+    descending = order_col.checkbox("Descending", key=f"{key}_desc")
+    filter_column = filter_col.selectbox("Filter column", [NO_COLUMN] + names, key=f"{key}_filter_col")
+    filter_text = text_col.text_input("Contains", key=f"{key}_filter_text")
+
+    try:
+        view = result.view(
+            None if sort_by == NO_COLUMN else sort_by,
+            descending,
+            None if filter_column == NO_COLUMN else filter_column,
+            filter_text.strip(),
+        )
+    except Exception as e:
+        st.error(f"Can't sort or filter on that column: {e}")
+        view = result.table
+
+    size_col, page_col = st.columns(2)
+    page_size = size_col.selectbox("Rows per page", PAGE_SIZES, key=f"{key}_page_size")
+    pages = max(1, math.ceil(view.num_rows / page_size))
+    page = page_col.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1, key=f"{key}_page")
+
+    start = (int(page) - 1) * page_size
+    window = view.slice(start, page_size)
+    st.dataframe(window.to_pandas(types_mapper=pd.ArrowDtype), use_container_width=True)
+
+    caption = f"Rows {min(start + 1, view.num_rows):,}-{start + window.num_rows:,} of {view.num_rows:,}"
+    if view.num_rows != result.num_rows:
+        caption += f" (filtered from {result.num_rows:,})"
+    st.caption(caption)
+    show_result_notes(result)
+
+
+def show_result_notes(result):
+    """Tell the user when the query guard changed what ran (row cap, date range)."""
+    if result.notes:
+        st.caption("Note: the query was " + "; ".join(result.notes) + ".")
@@ -0,0 +1,306 @@
+# Precomputed rollups over the common dimensions
+#
+# Most generated queries group the sales table by one or two of a handful of
+# dimensions and sum Quantity or revenue. One GROUPING SETS query (on the local
+# DuckDB copy when there is one, otherwise on BigQuery) precomputes every
+# single-dimension and two-dimension group, plus the grand total. Each group
+# is kept as a small Arrow table ("cuboid") and written to Parquet under
+# ROLLUP_DIR. try_query() answers generated SQL from the smallest cuboid that
+# covers it. A cuboid holds one row per group, not one per sale, so only
+# aggregate queries qualify: every measure must sit inside a SUM / AVG /
+# COUNT the cuboid can re-aggregate (AVG divides by the non-null count), and
+# every dimension read outside an aggregate must be grouped on. COUNT(dim)
+# and COUNT(DISTINCT dim) are exact on a cuboid that keeps `dim`. Anything
+# else returns None, and the query goes on to the local engine or BigQuery.
+
+import itertools
+import os
+import re
+import threading
+import time
+
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from utils.local_engine import bigquery_connection, duckdb, local_engine
+from utils.query_guard import wait_for_result
+from utils.result_download import download_arrow
+from utils.schema_catalog import TABLE_ID, schema_catalog
+
+ROLLUP_DIR = os.environ.get("ROLLUP_DIR") or None
+MAX_AGE_SECONDS = int(os.environ.get("ROLLUP_MAX_AGE_SECONDS", 60 * 60))
+
+DIMENSIONS = ("CustomerCountry", "CustomerCategory", "ProductLensType", "ProductMaterialType",
+              "SalesPersonName", "Return_item_cause", "InvoiceDate")
+
+# Rollup column -> aggregate over the base table
+MEASURES = {
+    "rollup_quantity": "SUM(Quantity)",
+    "rollup_quantity_rows": "COUNT(Quantity)",
+    "rollup_revenue": "SUM(Quantity * ProductPrice)",
+    "rollup_price": "SUM(ProductPrice)",
+    "rollup_price_rows": "COUNT(ProductPrice)",
+    "rollup_rows": "COUNT(*)",
+}
+
+_COL = r"(?:\w+\.)?`?{}`?"   # Optional table alias and backticks around a column name
+# Aggregates over the base table that can be re-aggregated from the rollup measures
+_REWRITES = [
+    (rf"sum\s*\(\s*{_COL.format('Quantity')}\s*\*\s*{_COL.format('ProductPrice')}\s*\)", "SUM(rollup_revenue)"),
+    (rf"sum\s*\(\s*{_COL.format('ProductPrice')}\s*\*\s*{_COL.format('Quantity')}\s*\)", "SUM(rollup_revenue)"),
+    (rf"sum\s*\(\s*{_COL.format('Quantity')}\s*\)", "SUM(rollup_quantity)"),
+    (rf"sum\s*\(\s*{_COL.format('ProductPrice')}\s*\)", "SUM(rollup_price)"),
+    (rf"avg\s*\(\s*{_COL.format('Quantity')}\s*\)", "(SUM(rollup_quantity) / SUM(rollup_quantity_rows))"),
+    (rf"avg\s*\(\s*{_COL.format('ProductPrice')}\s*\)", "(SUM(rollup_price) / SUM(rollup_price_rows))"),
+    (r"count\s*\(\s*(?:\*|1)\s*\)", "COALESCE(SUM(rollup_rows), 0)"),
+]
+_REWRITES = [(re.compile(pattern, re.IGNORECASE), replacement) for pattern, replacement in _REWRITES]
+# COUNT(col) / COUNT(DISTINCT col); only rewritten when col is a dimension
+_COUNT = re.compile(r"count\s*\(\s*(distinct\s+)?(?:\w+\.)?`?(\w+)`?\s*\)", re.IGNORECASE)
+# Aggregates left after the rewrites have no rollup equivalent
+_AGGREGATE = re.compile(
+    r"\b(count|countif|sum|avg|min|max|any_value|array_agg|string_agg|approx_\w+|stddev\w*|var_\w+|variance|"
+    r"logical_and|logical_or|bit_\w+)\s*\(",
+    re.IGNORECASE,
+)
+# Joins, subqueries, set operations and window functions need the base table
+_SHAPE = re.compile(r"\b(join|union|intersect|except|over|with|qualify|unnest)\b|select\s+(distinct\s+)?\*|\.\*",
+                    re.IGNORECASE)
+_CLAUSES = re.compile(
+    r"^\s*select\s+(?:distinct\s+)?(?P<select>.*?)\s+from\s+\S+(?:\s+(?:as\s+)?(?!(?:where|group|having|order|limit)\b)\w+)?"
+    r"(?:\s+where\s+(?P<where>.*?))?(?:\s+group\s+by\s+(?P<group>.*?))?(?:\s+having\s+(?P<having>.*?))?"
+    r"(?:\s+order\s+by\s+(?P<order>.*?))?(?:\s+limit\s+\d+(?:\s+offset\s+\d+)?)?\s*;?\s*$",
+    re.IGNORECASE | re.S,
+)
+_ALIAS = re.compile(r"\bas\s+`?(\w+)`?", re.IGNORECASE)
+_HELD = re.compile(r"__held_(\d+)__")
+_IDENT = re.compile(r"\b\w+\b")
+_STRING = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+
+
+def _split_items(text):
+    """Top-level comma-separated items of a SELECT list or GROUP BY clause."""
+    items, depth, start = [], 0, 0
+    for i, char in enumerate(text):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            items.append(text[start:i].strip())
+            start = i + 1
+    if text.strip():
+        items.append(text[start:].strip())
+    return items
+
+
+def cuboid_name(dimensions):
+    return "__".join(dimensions) or "total"
+
+
+def grouping_sets_sql(table_id=TABLE_ID, dimensions=DIMENSIONS):
+    """One query computing the grand total and every 1- and 2-dimension group."""
+    sets = [()] + [(d,) for d in dimensions] + list(itertools.combinations(dimensions, 2))
+    grouping_sets = ", ".join("(" + ", ".join(s) + ")" for s in sets)
+    flags = ", ".join(f"GROUPING({d}) AS g_{d}" for d in dimensions)
+    measures = ", ".join(f"{expr} AS {name}" for name, expr in MEASURES.items())
+    return (f"SELECT {', '.join(dimensions)}, {flags}, {measures} "
+            f"FROM `{table_id}` GROUP BY GROUPING SETS ({grouping_sets})"), sets
+
+
+class RollupStore:
+    def __init__(self, table_id=TABLE_ID, directory=ROLLUP_DIR, dimensions=DIMENSIONS,
+                 max_age_seconds=MAX_AGE_SECONDS):
+        self.table_id = table_id
+        self.table_name = table_id.rsplit(".", 1)[-1]
+        self.directory = directory
+        self.dimensions = tuple(dimensions)
+        self.max_age_seconds = max_age_seconds
+        self._cuboids = {}          # frozenset(dimensions) -> Arrow table
+        self._built_at = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._conn = None
+        self._stats = {"answered": 0, "not_covered": 0, "builds": 0}
+
+    @property
+    def enabled(self):
+        return duckdb is not None and self.directory is not None
+
+    @property
+    def fresh(self):
+        return self._built_at is not None and time.time() - self._built_at <= self.max_age_seconds
+
+    def build(self, client):
+        """Recompute every cuboid now (blocking): one scan of the table in total."""
+        sql, sets = grouping_sets_sql(self.table_id, self.dimensions)
+        table = local_engine.try_query(sql)     # Free and fast when the local copy is fresh
+        if table is None:
+            table = download_arrow(wait_for_result(client.query(sql), None))
+
+        cuboids = {}
+        for dims in sets:
+            mask = None
+            for d in self.dimensions:
+                condition = pc.equal(table[f"g_{d}"], 0 if d in dims else 1)
+                mask = condition if mask is None else pc.and_(mask, condition)
+            cuboids[frozenset(dims)] = table.filter(mask).select(list(dims) + list(MEASURES))
+
+        os.makedirs(self.directory, exist_ok=True)
+        for dims, cuboid in cuboids.items():
+            path = os.path.join(self.directory, f"{cuboid_name(sorted(dims))}.parquet")
+            pq.write_table(cuboid, f"{path}.tmp", compression="zstd")
+            os.replace(f"{path}.tmp", path)
+        with self._lock:
+            self._cuboids = cuboids
+            self._built_at = time.time()
+            self._stats["builds"] += 1
+
+    def load(self):
+        """Pick up cuboids written by an earlier build, if they are still fresh enough."""
+        if not self.enabled or not os.path.isdir(self.directory):
+            return
+        sets = [()] + [(d,) for d in self.dimensions] + list(itertools.combinations(self.dimensions, 2))
+        cuboids, oldest = {}, None
+        for dims in sets:
+            path = os.path.join(self.directory, f"{cuboid_name(sorted(dims))}.parquet")
+            if not os.path.exists(path):
+                return
+            cuboid = pq.read_table(path)
+            if not set(MEASURES) <= set(cuboid.column_names):
+                return      # Written before a measure was added; build again
+            cuboids[frozenset(dims)] = cuboid
+            oldest = min(oldest or time.time(), os.path.getmtime(path))
+        with self._lock:
+            self._cuboids, self._built_at = cuboids, oldest
+
+    def ensure_fresh(self, client):
+        """Rebuild in a background thread when the rollups are missing or stale."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self.fresh or self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, args=(client,), name="rollup-build", daemon=True).start()
+
+    def _refresh(self, client):
+        try:
+            if self._built_at is None:
+                self.load()     # Cuboids written before a restart may still be fresh
+            if not self.fresh:
+                self.build(client)
+        except Exception:
+            pass  # Queries skip the rollups until a build succeeds
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def match(self, sql, cuboids):
+        """(cuboid dimensions, rewritten SQL) if `sql` can be answered from one of
+        `cuboids`, else None."""
+        columns = {name.lower() for name in schema_catalog.column_names}
+        dimensions = {d.lower(): d for d in self.dimensions}
+
+        # String literals and rewritten aggregates are set aside as __held_N__
+        # so the checks below only see what is left outside them
+        held, aggregated = [], set()
+
+        def hold(text):
+            held.append(text)
+            return f" __held_{len(held) - 1}__ "
+
+        def count(m):
+            dimension = dimensions.get(m.group(2).lower())
+            if dimension is None:
+                return m.group(0)   # COUNT(measure) counts non-null rows the cuboids don't keep
+            aggregated.add(dimension)
+            if m.group(1):
+                return hold(f"COUNT(DISTINCT {dimension})")
+            return hold(f"COALESCE(SUM(CASE WHEN {dimension} IS NOT NULL THEN rollup_rows END), 0)")
+
+        body = _STRING.sub(lambda m: hold(m.group(0)), sql)
+        if _SHAPE.search(body) or len(re.findall(r"\bselect\b", body, re.IGNORECASE)) != 1:
+            return None
+        strings = len(held)
+        for pattern, replacement in _REWRITES:
+            body = pattern.sub(lambda m: hold(replacement), body)
+        body = _COUNT.sub(count, body)
+        if _AGGREGATE.search(body):
+            return None             # An aggregate with no rollup equivalent
+        clauses = _CLAUSES.match(body)
+        if clauses is None or (clauses["group"] is None and len(held) == strings):
+            return None             # Row-level queries read individual sales
+
+        aliases = {a.lower() for a in _ALIAS.findall(body)}
+        for token in _IDENT.findall(body):
+            lowered = token.lower()
+            if lowered in columns and lowered not in dimensions and lowered not in aliases:
+                return None         # A measure outside a supported aggregate (or a non-rollup column)
+        if clauses["where"] and any(t.lower() in columns and t.lower() not in dimensions
+                                    for t in _IDENT.findall(clauses["where"])):
+            return None             # Row-level filters on measures need the base table
+
+        def dims_in(text):
+            return {dimensions[t.lower()] for t in _IDENT.findall(text) if t.lower() in dimensions}
+
+        # Each cuboid row is a group, so a dimension outside an aggregate must be grouped on
+        items = _split_items(clauses["select"])
+        item_aliases = [(_ALIAS.search(item) or [None, None])[1] for item in items]
+        grouped = set()
+        for entry in _split_items(clauses["group"] or ""):
+            if entry.isdigit() and 0 < int(entry) <= len(items):
+                entry = items[int(entry) - 1]
+            elif entry.lower() in [a.lower() for a in item_aliases if a]:
+                entry = items[[(a or "").lower() for a in item_aliases].index(entry.lower())]
+            grouped |= dims_in(entry)
+        for text in items + [clauses["having"] or "", clauses["order"] or ""]:
+            if not dims_in(text) <= grouped:
+                return None
+
+        used = dims_in(body) | aggregated
+        candidates = [dims for dims in cuboids if used <= dims]
+        if not candidates:
+            return None
+        best = min(candidates, key=lambda dims: cuboids[dims].num_rows)
+        rewritten = _HELD.sub(lambda m: held[int(m.group(1))], body)
+        return best, local_engine.translate(rewritten)
+
+    def try_query(self, sql):
+        """Arrow table for `sql` computed from the rollups, or None."""
+        if not self.enabled or not self.fresh:
+            return None
+        with self._lock:
+            cuboids = self._cuboids
+        matched = self.match(sql, cuboids)
+        if matched is None or matched[1] is None:
+            self._count("not_covered")
+            return None
+        dims, translated = matched
+        try:
+            cursor = self._cursor()
+            cursor.register(self.table_name, cuboids[dims])    # Visible to this cursor only
+            table = cursor.execute(translated).fetch_arrow_table()
+        except duckdb.Error:
+            self._count("not_covered")
+            return None
+        self._count("answered")
+        return table
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, cuboids=len(self._cuboids),
+                        age_seconds=time.time() - self._built_at if self._built_at else None)
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _cursor(self):
+        with self._lock:
+            if self._conn is None:
+                self._conn = bigquery_connection()     # Cuboids are registered per cursor
+            return self._conn.cursor()
+
+
+rollup_store = RollupStore()
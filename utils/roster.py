@@ -0,0 +1,35 @@
+# Team roster loaded from a data file
+#
+# The roster lives in data/ as JSON, CSV or Parquet (picked by extension).
+# It is parsed once and cached until the file's mtime changes, so editing the
+# file shows up on the next rerun without restarting the server.
+
+import csv
+import json
+import os
+from functools import lru_cache
+
+from utils.image_assets import asset_path
+
+
+@lru_cache(maxsize=8)
+def _load(path, mtime_ns):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".json":
+        with open(path, encoding="utf-8") as f:
+            members = json.load(f)
+    elif extension == ".csv":
+        with open(path, newline="", encoding="utf-8") as f:
+            members = list(csv.DictReader(f))
+    elif extension == ".parquet":
+        import pandas as pd
+        members = pd.read_parquet(path).to_dict("records")
+    else:
+        raise ValueError(f"Unsupported roster format: {path}")
+    return tuple(members)
+
+
+def load_roster(path):
+    """Members as a tuple of dicts with at least "name" and "image_path"."""
+    path = asset_path(path)
+    return _load(path, os.stat(path).st_mtime_ns)
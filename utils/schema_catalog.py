@@ -0,0 +1,151 @@
+# Schema catalog for the chatbot's BigQuery table
+#
+# One place for the data dictionary instead of a copy in every page. The
+# catalog starts from the built-in description below and replaces it with the
+# live schema (names, types, descriptions) from BigQuery as soon as a client
+# is available, refreshing it in the background once it is older than the TTL.
+# prompt_fragment() renders only the columns a question seems to need, and
+# `version` (a hash of the schema) keys the caches that depend on it.
+
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+
+TABLE_ID = "madt-finalproject.finalproject_data.transaction_summary_with_sales"
+REFRESH_SECONDS = int(os.environ.get("SCHEMA_REFRESH_SECONDS", 60 * 60))
+MIN_PROMPT_COLUMNS = 1      # Below this many matches the question is too vague, send everything
+
+Column = namedtuple("Column", ["name", "data_type", "description"])
+
+DEFAULT_COLUMNS = (
+    Column("ProductId", "STRING", "ProductId"),
+    Column("InvoiceNo", "STRING", "Invoice number."),
+    Column("Return_item_cause_id", "STRING", "Return Item cause id"),
+    Column("Quantity", "INT64", "Quantity of products in each invoice."),
+    Column("CustomerID", "STRING", "Customer ID."),
+    Column("InvoiceDate", "DATE", "Date of Invoice."),
+    Column("CustomerName", "STRING", "Customer name."),
+    Column("CustomerCountry", "STRING", "Country of Customer located"),
+    Column("CustomerCategory", "STRING", "Category of Customer"),
+    Column("ProductDescription", "STRING", "Product description"),
+    Column("ProductMaterialType", "STRING", "Material of Product"),
+    Column("ProductLensType", "STRING", "Type of lens."),
+    Column("ProductPrice", "FLOAT64", "Price of each product."),
+    Column("Return_item_cause", "STRING", "Cause of Return Item"),
+    Column("SalesPersonName", "STRING", "Sale Person name"),
+    Column("SalesPersonAvgRoundTripHours", "FLOAT64", "Sale Person average round trip hours"),
+)
+
+RELATIONS = ("The 'CustomerID' column in the 'transaction_summary_with_sales' table is a one-to-one "
+             "relationship with the 'CustomerID' column in the 'customer' table.")
+
+_CAMEL = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+_WORD = re.compile(r"[a-z0-9_]+")
+
+
+def split_column_name(name):
+    """Lower-case words in a column name, e.g. ProductLensType -> product, lens, type."""
+    words = []
+    for part in name.split("_"):
+        words.extend(w.lower() for w in _CAMEL.findall(part))
+    return words
+
+
+def column_words(columns):
+    words = set()
+    for name in columns:
+        words.add(name.lower())
+        words.update(split_column_name(name))
+    return words
+
+
+def _version(table_id, columns):
+    text = table_id + "\n" + "\n".join("|".join(column) for column in columns)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+
+class SchemaCatalog:
+    def __init__(self, table_id=TABLE_ID, columns=DEFAULT_COLUMNS, refresh_seconds=REFRESH_SECONDS):
+        self.table_id = table_id
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._loaded_at = None          # None until the live schema has been fetched
+        self._set_columns(tuple(columns))
+
+    @property
+    def columns(self):
+        return self._columns
+
+    @property
+    def column_names(self):
+        return tuple(column.name for column in self._columns)
+
+    @property
+    def version(self):
+        return self._version
+
+    def _set_columns(self, columns):
+        # Swap both together so readers never see a new schema with an old version
+        self._columns, self._version = columns, _version(self.table_id, columns)
+
+    # -- loading ----------------------------------------------------------
+
+    def load(self, client):
+        """Fetch the live schema now (blocking)."""
+        table = client.get_table(self.table_id)
+        columns = tuple(
+            Column(field.name, field.field_type, field.description or field.name) for field in table.schema
+        )
+        with self._lock:
+            if columns:
+                self._set_columns(columns)
+            self._loaded_at = time.time()
+
+    def ensure_fresh(self, client):
+        """Refresh in a background thread if the schema was never loaded or is stale."""
+        with self._lock:
+            stale = self._loaded_at is None or time.time() - self._loaded_at > self.refresh_seconds
+            if not stale or self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, args=(client,), name="schema-refresh", daemon=True).start()
+
+    def _refresh(self, client):
+        try:
+            self.load(client)
+        except Exception:
+            pass  # Keep serving what we have; the next ensure_fresh() tries again
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    # -- prompts ----------------------------------------------------------
+
+    def relevant_columns(self, question):
+        """Columns whose name words appear in `question`, or all of them if too few match."""
+        if not question:
+            return self._columns
+        words = set(_WORD.findall(question.lower()))
+        matched = [
+            column for column in self._columns
+            if column.name.lower() in words or words & set(split_column_name(column.name))
+        ]
+        return tuple(matched) if len(matched) >= MIN_PROMPT_COLUMNS else self._columns
+
+    def prompt_fragment(self, question=None):
+        """Compact data dictionary text for a prompt, limited to the relevant columns."""
+        columns = self.relevant_columns(question)
+        lines = [f"Table '{self.table_id}' columns (name, type: description):"]
+        lines += [f"- {c.name}, {c.data_type}: {c.description}" for c in columns]
+        if len(columns) < len(self._columns):
+            lines.append(f"(Other columns: {', '.join(c.name for c in self._columns if c not in columns)})")
+        lines.append(RELATIONS)
+        return "\n".join(lines)
+
+
+# One catalog for the whole server process
+schema_catalog = SchemaCatalog()
@@ -0,0 +1,277 @@
+# Reuse validated SQL for paraphrased questions
+#
+# The LLM cache only helps when a question is asked word for word again.
+# Here every question whose SQL ran successfully is embedded and kept in an
+# in-process NumPy index. A new question reuses that SQL when it is close
+# enough to an earlier one (cosine similarity over the threshold) and both
+# questions mention the same numbers, the same columns, the same intent
+# words (direction, sort order, negation, aggregates) and the same remaining
+# content words, such as the country or category a question filters on. That
+# check is what keeps "top 10" from reusing the SQL for "top 5" or "bottom
+# 10", lens type from reusing material type, "unique product id" from reusing
+# "count of unique product id", and Thailand from reusing Japan. The default embedding is a local
+# hashed bag of canonical words, word pairs and character trigrams, in which
+# the words naming a column count as that column, so "avg round trip" and
+# "round trip hours" embed alike; a lookup costs well under a millisecond.
+# Setting SEMANTIC_CACHE_EMBEDDING_MODEL switches to Gemini embeddings
+# instead. Entries are tied to the schema version and evicted least recently
+# used first, and a cached SQL then goes through the result cache like any
+# other.
+
+import functools
+import os
+import re
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+from utils import metrics
+from utils.schema_catalog import schema_catalog, split_column_name
+
+THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", 0.85))
+MAX_ENTRIES = int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", 2048))
+TTL_SECONDS = int(os.environ.get("SEMANTIC_CACHE_TTL_SECONDS", 7 * 24 * 60 * 60))
+EMBEDDING_MODEL = os.environ.get("SEMANTIC_CACHE_EMBEDDING_MODEL") or None
+DIMENSIONS = 1024
+
+Entry = namedtuple("Entry", ["question", "sql", "numbers", "columns", "intent", "content", "created_at"])
+
+_WORD = re.compile(r"[a-z0-9]+")
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+_QUOTED = re.compile(r"'([^']*)'|\"([^\"]*)\"")
+
+STOPWORDS = {
+    "i", "me", "my", "we", "you", "a", "an", "the", "of", "to", "for", "in", "on", "at", "by", "and",
+    "or", "is", "are", "was", "be", "it", "its", "that", "this", "what", "which", "who", "whose",
+    "want", "wanna", "know", "tell", "give", "get", "find", "please", "can", "could", "would",
+    "do", "does", "have", "has", "with", "from", "all", "there", "their", "them", "about",
+    "show", "list", "display", "see", "need", "each", "per", "every", "how", "much", "like", "let", "us",
+    "our", "your", "these", "those", "only", "just", "some", "any", "been", "were", "will", "should", "also",
+}
+# Different words for the same thing, mapped onto one canonical word
+CANONICAL = {
+    "rep": "salesperson", "reps": "salesperson", "seller": "salesperson", "sellers": "salesperson",
+    "salesman": "salesperson", "salespeople": "salesperson", "salespersons": "salesperson",
+    "avg": "average", "mean": "average",
+    "highest": "top", "most": "top", "max": "top", "maximum": "top", "best": "top", "largest": "top",
+    "greatest": "top", "biggest": "top",
+    "lowest": "bottom", "least": "bottom", "min": "bottom", "minimum": "bottom", "worst": "bottom",
+    "smallest": "bottom", "fewest": "bottom",
+    "asc": "ascending", "increasing": "ascending", "desc": "descending", "decreasing": "descending",
+    "excluding": "not", "exclude": "not", "excluded": "not", "except": "not", "without": "not",
+    "besides": "not", "don": "not", "doesn": "not", "isn": "not", "aren": "not", "didn": "not",
+    "unique": "distinct", "different": "distinct",
+    "qty": "quantity", "amount": "quantity", "ids": "id",
+    "number": "count", "many": "count",
+    "province": "country", "provinces": "country", "region": "country",
+}
+PHRASES = {"sales person": "salesperson", "sale person": "salesperson", "sales rep": "salesperson",
+           "round trip": "roundtrip", "how many": "count"}
+GENERIC = {"id", "name", "type", "date", "no", "item", "cause", "product", "customer"}
+# Words that change what a question asks for, however close the rest of it is
+INTENT_WORDS = {
+    "top", "bottom",                            # direction
+    "ascending", "descending",                  # sort order
+    "not",                                      # negation
+    "count", "sum", "average", "distinct",      # aggregates
+}
+
+
+def canonical_words(text):
+    text = text.lower()
+    for phrase, word in PHRASES.items():
+        text = text.replace(phrase, word)
+    words = []
+    for word in _WORD.findall(text):
+        word = CANONICAL.get(word, word)
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = CANONICAL.get(word[:-1], word[:-1])
+        if word not in STOPWORDS:
+            words.append(word)
+    return words
+
+
+def literals(text):
+    """Numbers and quoted values in `text`; reusing SQL needs these to be identical."""
+    quoted = tuple(sorted(a or b for a, b in _QUOTED.findall(text)))
+    return tuple(sorted(_NUMBER.findall(text))), quoted
+
+
+@functools.lru_cache(maxsize=8)
+def _column_words(columns):
+    """Each column's canonical words, and the words specific to at most two columns."""
+    parts = {}
+    owners = {}
+    for column in columns:
+        words = set(canonical_words(" ".join(split_column_name(column)))) | {column.lower()}
+        if "sales" in words and "person" in words:
+            words.add("salesperson")
+        if "round" in words and "trip" in words:
+            words.add("roundtrip")
+        parts[column] = words
+        for word in words - GENERIC - INTENT_WORDS:
+            owners.setdefault(word, set()).add(column)
+    return parts, {word: owned for word, owned in owners.items() if len(owned) <= 2}
+
+
+def mentioned_columns(text, columns):
+    """Columns `text` refers to through a word specific to at most two columns."""
+    _, owners = _column_words(tuple(columns))
+    mentioned = set()
+    for word in canonical_words(text):
+        mentioned |= owners.get(word, set())
+    return frozenset(mentioned)
+
+
+def intent_words(text, columns):
+    """Direction, sort, negation and aggregate words in `text`; reusing SQL needs
+    these to be identical. A word that is part of a mentioned column's name
+    ("avg round trip hours") belongs to the column, not to the question."""
+    parts, _ = _column_words(tuple(columns))
+    words = set(canonical_words(text)) & INTENT_WORDS
+    for column in mentioned_columns(text, columns):
+        words -= parts[column]
+    return frozenset(words)
+
+
+def question_terms(text, columns):
+    """Canonical words of `text`, with the words naming a mentioned column
+    replaced by that column (once)."""
+    parts, owners = _column_words(tuple(columns))
+    mentioned = mentioned_columns(text, columns)
+    named = set().union(*(parts[column] for column in mentioned))
+    terms = []
+    for word in canonical_words(text):
+        if word in owners:
+            terms.extend(column.lower() for column in sorted(owners[word]) if column.lower() not in terms)
+        elif word not in named:
+            terms.append(word)
+    return terms
+
+
+def content_words(text, columns):
+    """Terms of `text` other than columns, numbers and intent words: the entities
+    and values it asks about ("thailand"). Reusing SQL needs these to be identical."""
+    names = {column.lower() for column in columns}
+    return frozenset(term for term in question_terms(text, columns)
+                     if term not in names and term not in INTENT_WORDS and not _NUMBER.fullmatch(term))
+
+
+def hashed_embedding(text, dimensions=DIMENSIONS):
+    """L2-normalized hashed features: terms, adjacent term pairs and character trigrams."""
+    words = question_terms(text, schema_catalog.column_names)
+    vector = np.zeros(dimensions, dtype=np.float32)
+    features = [(w, 1.0) for w in words]
+    features += [(f"{a} {b}", 0.5) for a, b in zip(words, words[1:])]
+    features += [(f"#{w[i:i + 3]}", 0.2) for w in words for i in range(max(1, len(w) - 2))]
+    for feature, weight in features:
+        vector[zlib.crc32(feature.encode("utf-8")) % dimensions] += weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def gemini_embedding(model_name):
+    """Embedding function backed by the Gemini embedding API."""
+    import google.generativeai as genai
+
+    def embed(text):
+        vector = np.asarray(genai.embed_content(model=model_name, content=text)["embedding"], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+    return embed
+
+
+class SemanticCache:
+    def __init__(self, embed=None, threshold=THRESHOLD, max_entries=MAX_ENTRIES, ttl_seconds=TTL_SECONDS):
+        self.embed = embed or hashed_embedding
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._schema = None
+        self._entries = []
+        self._matrix = None          # One normalized embedding per entry, same order
+        self._last_used = []
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "rejected": 0, "evictions": 0}
+
+    def lookup(self, question, schema):
+        """Validated SQL of an earlier question that means the same, or None."""
+        with metrics.span("semantic_cache"):
+            vector = self.embed(question)
+            numbers = literals(question)
+            columns = mentioned_columns(question, schema_catalog.column_names)
+            intent = intent_words(question, schema_catalog.column_names)
+            content = content_words(question, schema_catalog.column_names)
+            with self._lock:
+                self._check_schema(schema)
+                if not self._entries:
+                    self._stats["misses"] += 1
+                    return None
+                scores = self._matrix @ vector
+                now = time.time()
+                for index in np.argsort(scores)[::-1]:
+                    if scores[index] < self.threshold:
+                        break
+                    entry = self._entries[index]
+                    if now - entry.created_at > self.ttl_seconds:
+                        continue
+                    if (entry.numbers, entry.columns, entry.intent, entry.content) != (numbers, columns, intent, content):
+                        self._stats["rejected"] += 1   # Similar wording, different question
+                        continue
+                    self._last_used[index] = now
+                    self._stats["hits"] += 1
+                    return entry.sql
+                self._stats["misses"] += 1
+                return None
+
+    def add(self, question, sql, schema):
+        """Remember `sql` (which ran successfully) as the answer to `question`."""
+        vector = self.embed(question)
+        columns = schema_catalog.column_names
+        entry = Entry(question, sql, literals(question), mentioned_columns(question, columns),
+                      intent_words(question, columns), content_words(question, columns), time.time())
+        with self._lock:
+            self._check_schema(schema)
+            for i, existing in enumerate(self._entries):
+                if existing.question == question:
+                    self._entries[i], self._last_used[i] = entry, entry.created_at
+                    self._matrix[i] = vector
+                    return
+            self._entries.append(entry)
+            self._last_used.append(entry.created_at)
+            row = vector[np.newaxis, :]
+            self._matrix = row if self._matrix is None else np.vstack([self._matrix, row])
+            if len(self._entries) > self.max_entries:
+                self._evict(len(self._entries) - self.max_entries)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries, self._last_used, self._matrix = [], [], None
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return dict(self._stats, entries=len(self._entries),
+                        hit_rate=self._stats["hits"] / lookups if lookups else 0.0)
+
+    # -- internals (callers hold self._lock) -------------------------------
+
+    def _check_schema(self, schema):
+        # SQL written for another schema version may name columns that no longer exist
+        if schema != self._schema:
+            self._schema = schema
+            self._entries, self._last_used, self._matrix = [], [], None
+
+    def _evict(self, count):
+        keep = np.sort(np.argsort(self._last_used)[count:])
+        self._entries = [self._entries[i] for i in keep]
+        self._last_used = [self._last_used[i] for i in keep]
+        self._matrix = self._matrix[keep]
+        self._stats["evictions"] += count
+
+
+# One index for the whole server process
+semantic_cache = SemanticCache(embed=gemini_embedding(EMBEDDING_MODEL) if EMBEDDING_MODEL else None)
@@ -0,0 +1,142 @@
+# Server-wide accounting of what Streamlit sessions keep in memory
+#
+# Every chatbot page calls track_session() at the end of a run. It measures
+# what the session holds (query results, chat history and everything else in
+# st.session_state) and remembers the large objects through weak references,
+# so finished sessions drop out by themselves. When the total goes over
+# SESSION_MEMORY_BUDGET_BYTES, the least recently active sessions give memory
+# back first. Pandas copies of results go first, then old chat history is
+# spilled to disk, then whole results are released (the shared result cache
+# can usually bring them back without BigQuery).
+
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import deque
+
+import pandas as pd
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from utils.chat_history import ChatHistory
+from utils.result_download import QueryResult
+
+MEMORY_BUDGET_BYTES = int(os.environ.get("SESSION_MEMORY_BUDGET_BYTES", 1024 ** 3))
+
+_lock = threading.Lock()
+_sessions = {}  # session id -> {"last_seen", "other_bytes", "results", "histories"}
+
+
+def estimate_bytes(obj, _depth=0):
+    """Rough size of a session state value in bytes."""
+    if isinstance(obj, (QueryResult, ChatHistory)):
+        return obj.nbytes()
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, (str, bytes)):
+        return len(obj)
+    if _depth < 4 and isinstance(obj, dict):
+        return sum(estimate_bytes(k, _depth + 1) + estimate_bytes(v, _depth + 1) for k, v in obj.items())
+    if _depth < 4 and isinstance(obj, (list, tuple, set, deque)):
+        return sum(estimate_bytes(v, _depth + 1) for v in obj)
+    return sys.getsizeof(obj)
+
+
+def _find_managed(obj, results, histories, _depth=0):
+    # QueryResult / ChatHistory objects can be anywhere, e.g. inside the qry_result memo dict
+    if isinstance(obj, QueryResult):
+        results.append(weakref.ref(obj))
+    elif isinstance(obj, ChatHistory):
+        histories.append(weakref.ref(obj))
+    elif _depth < 3 and isinstance(obj, dict):
+        for value in obj.values():
+            _find_managed(value, results, histories, _depth + 1)
+    elif _depth < 3 and isinstance(obj, (list, tuple)):
+        for value in obj:
+            _find_managed(value, results, histories, _depth + 1)
+
+
+def track_session(session_state):
+    """Record the current session's footprint and enforce the global budget."""
+    ctx = get_script_run_ctx()
+    session_id = ctx.session_id if ctx else "no-session"
+    state = session_state.to_dict()
+
+    results, histories, other_bytes = [], [], 0
+    for value in state.values():
+        before = len(results) + len(histories)
+        _find_managed(value, results, histories)
+        if len(results) + len(histories) == before:
+            other_bytes += estimate_bytes(value)
+
+    with _lock:
+        _sessions[session_id] = {
+            "last_seen": time.time(),
+            "other_bytes": other_bytes,
+            "results": results,
+            "histories": histories,
+        }
+    enforce_budget()
+
+
+def _alive(refs):
+    return [obj for obj in (ref() for ref in refs) if obj is not None]
+
+
+def _session_bytes(entry):
+    managed = _alive(entry["results"]) + _alive(entry["histories"])
+    return entry["other_bytes"] + sum(obj.nbytes() for obj in managed)
+
+
+def memory_report():
+    """Per-session and total bytes, most recently active session first."""
+    with _lock:
+        entries = list(_sessions.items())
+    sessions = []
+    for session_id, entry in entries:
+        results = _alive(entry["results"])
+        histories = _alive(entry["histories"])
+        if not results and not histories and time.time() - entry["last_seen"] > 24 * 60 * 60:
+            with _lock:
+                _sessions.pop(session_id, None)  # Long gone
+            continue
+        sessions.append({
+            "session_id": session_id,
+            "last_seen": entry["last_seen"],
+            "results_bytes": sum(r.nbytes() for r in results),
+            "history_bytes": sum(h.nbytes() for h in histories),
+            "other_bytes": entry["other_bytes"],
+        })
+    for session in sessions:
+        session["total_bytes"] = session["results_bytes"] + session["history_bytes"] + session["other_bytes"]
+    sessions.sort(key=lambda s: s["last_seen"], reverse=True)
+    return {"total_bytes": sum(s["total_bytes"] for s in sessions), "budget_bytes": MEMORY_BUDGET_BYTES,
+            "sessions": sessions}
+
+
+def enforce_budget(budget=MEMORY_BUDGET_BYTES):
+    """Free memory, least recently active sessions first, until under `budget`.
+    Returns the number of bytes freed. This runs on the calling session's thread;
+    QueryResult and ChatHistory take their own locks, so their owners never see
+    them half-changed."""
+    with _lock:
+        entries = sorted(_sessions.values(), key=lambda e: e["last_seen"])
+    total = sum(_session_bytes(e) for e in entries)
+    if total <= budget:
+        return 0
+
+    freed = 0
+    steps = (
+        lambda e: [r.offload() for r in _alive(e["results"])],
+        lambda e: [h.trim() for h in _alive(e["histories"])],
+        lambda e: [r.release() for r in _alive(e["results"])],
+    )
+    for step in steps:
+        for entry in entries:
+            before = _session_bytes(entry)
+            step(entry)
+            freed += before - _session_bytes(entry)
+            if total - freed <= budget:
+                return freed
+    return freed
@@ -0,0 +1,165 @@
+# Fan-out SQL generation: several candidates, cheapest valid one runs
+#
+# Instead of trusting the first query Gemini writes, a few candidates are
+# requested at once (same question, slightly different instructions). Each is
+# dry-run through query_guard as soon as it arrives. Once one passes, the
+# others get a short grace period to finish. The cheapest valid candidate is
+# then executed, and candidates still waiting for a worker are cancelled.
+# When every candidate fails, or the chosen query fails at run time, the
+# BigQuery error is fed back to the model for a repair round.
+#
+# Off by default (SQL_CANDIDATE_COUNT=1): it multiplies Agent 02 calls, and the
+# pages only stream the SQL as it is written when a single query is asked for.
+# That single streamed query still gets the repair rounds (run_or_repair).
+# run_best_query itself runs on the agent_pipeline pool, so the candidates get
+# a pool of their own; sharing it would let waiting turns hold every worker
+# while their candidates queue behind them.
+
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from google.api_core.exceptions import GoogleAPICallError
+
+from utils.llm_cache import llm_cache, model_name, response_key
+from utils.query_guard import QueryRejected, guard_query
+from utils.result_cache import run_cached_query
+
+CANDIDATE_COUNT = int(os.environ.get("SQL_CANDIDATE_COUNT", 1))
+REPAIR_ROUNDS = int(os.environ.get("SQL_REPAIR_ROUNDS", 2))
+GRACE_SECONDS = float(os.environ.get("SQL_CANDIDATE_GRACE_SECONDS", 1.5))
+CANDIDATE_TIMEOUT = float(os.environ.get("SQL_CANDIDATE_TIMEOUT_SECONDS", 45))
+CANDIDATE_WORKERS = int(os.environ.get("SQL_CANDIDATE_WORKERS", 32))
+
+# Appended to the prompt so the candidates (and their cache keys) differ
+VARIANT_HINTS = [
+    "",
+    "Keep the query as simple as possible.",
+    "Aggregate in SQL so that only the rows needed for the answer are returned.",
+    "Select only the columns needed to answer the question.",
+]
+
+Candidate = namedtuple("Candidate", ["sql", "guarded", "error", "elapsed", "prompt"])
+
+# Shared by all sessions, separate from the agent_pipeline pool that run_best_query runs on
+_executor = ThreadPoolExecutor(max_workers=CANDIDATE_WORKERS, thread_name_prefix="sql-candidate")
+
+
+class NoValidQuery(Exception):
+    def __init__(self, message, attempts):
+        super().__init__(message)
+        self.attempts = attempts
+
+
+def error_message(error):
+    return getattr(error, "message", None) or str(error)
+
+
+def candidate_prompts(prompt, count):
+    return [f"{prompt} {hint}".strip() for hint in VARIANT_HINTS[:max(1, count)]]
+
+
+def repair_prompt(prompt, sql, error):
+    return (f"{prompt}\nA previous attempt produced this SQL:\n{sql}\n"
+            f"BigQuery rejected it with: {error}\n"
+            f"Return a corrected SQL query only.")
+
+
+def forget(model, prompt, agent, schema):
+    """Drop a cached reply whose SQL failed, so the question isn't answered with it again."""
+    llm_cache.delete(response_key(agent, model_name(model), prompt, schema))
+
+
+def propose(client, model, prompt, agent, schema, clean):
+    """Ask `model` for one query and dry-run it; never raises for bad SQL."""
+    started = time.monotonic()
+    sql = clean(llm_cache.generate(model, prompt, agent=agent, schema=schema))
+    try:
+        guarded = guard_query(client, sql)
+    except (QueryRejected, GoogleAPICallError) as e:
+        forget(model, prompt, agent, schema)
+        return Candidate(sql, None, error_message(e), time.monotonic() - started, prompt)
+    return Candidate(sql, guarded, None, time.monotonic() - started, prompt)
+
+
+def race(client, model, prompts, agent, schema, clean, grace=GRACE_SECONDS, timeout=CANDIDATE_TIMEOUT):
+    """Propose one candidate per prompt concurrently. Returns every candidate
+    that finished, with the cheapest valid one first (if there is one)."""
+    started = time.monotonic()
+    deadline = started + timeout
+    prompt_of = {_executor.submit(propose, client, model, p, agent, schema, clean): p for p in prompts}
+    pending = set(prompt_of)
+    finished = []
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                error = future.exception()
+                if error is None:
+                    finished.append(future.result())
+                else:
+                    # The model call itself failed; kept so the caller can report why
+                    finished.append(Candidate(None, None, error_message(error), time.monotonic() - started,
+                                              prompt_of[future]))
+            if any(c.guarded for c in finished):
+                # Something runnable exists; give the rest only a little longer
+                deadline = min(deadline, time.monotonic() + grace)
+    finally:
+        for future in pending:
+            future.cancel()   # Not-yet-started candidates are dropped; running ones are ignored
+    valid = sorted((c for c in finished if c.guarded), key=lambda c: c.guarded.estimated_bytes)
+    return valid + [c for c in finished if not c.guarded]
+
+
+def run_best_query(client, model, prompt, agent, schema="", clean=str.strip,
+                   count=CANDIDATE_COUNT, repair_rounds=REPAIR_ROUNDS, job_config=None, failed=None):
+    """Generate, validate and run SQL for `prompt`. Returns (sql, QueryResult,
+    attempts); raises NoValidQuery once the repair rounds are used up. `failed`
+    is a Candidate that already failed; the first round then repairs it."""
+    attempts = []
+    prompts = candidate_prompts(prompt, count)
+    rounds = repair_rounds + 1
+    if failed is not None:
+        attempts.append(failed)
+        prompts = [repair_prompt(prompt, failed.sql, failed.error)]
+        rounds = repair_rounds
+    for _ in range(rounds):
+        candidates = race(client, model, prompts, agent, schema, clean)
+        attempts.extend(candidates)
+        if candidates and candidates[0].guarded:
+            best = candidates[0]
+            try:
+                result = run_cached_query(client, best.sql, job_config=job_config, guarded=best.guarded)
+                return best.sql, result, attempts
+            except GoogleAPICallError as e:
+                # Valid on a dry run but failed for real (e.g. a bad cast); repair that one
+                forget(model, best.prompt, agent, schema)
+                attempts.append(best._replace(guarded=None, error=error_message(e)))
+                failures = [attempts[-1]]
+        else:
+            failures = [c for c in candidates if c.sql is not None]
+        if not failures:
+            break  # Every candidate timed out or its model call failed; nothing to repair from
+        unique = {c.sql: c for c in failures}.values()   # Identical SQL only needs repairing once
+        prompts = [repair_prompt(prompt, c.sql, c.error) for c in list(unique)[:max(1, count)]]
+
+    last_error = attempts[-1].error if attempts else "no candidate was generated in time"
+    raise NoValidQuery(f"Could not produce a valid query: {last_error}", attempts)
+
+
+def run_or_repair(client, model, prompt, agent, schema, sql, clean=str.strip,
+                  repair_rounds=REPAIR_ROUNDS, job_config=None):
+    """Run `sql`, already generated for `prompt`; when the guard or BigQuery
+    rejects it, the error goes back to `model` for the repair rounds. Returns
+    (sql, QueryResult, attempts) like run_best_query."""
+    started = time.monotonic()
+    try:
+        return sql, run_cached_query(client, sql, job_config=job_config), []
+    except (QueryRejected, GoogleAPICallError) as e:
+        forget(model, prompt, agent, schema)
+        failed = Candidate(sql, None, error_message(e), time.monotonic() - started, prompt)
+    return run_best_query(client, model, prompt, agent, schema, clean, count=1, repair_rounds=repair_rounds,
+                          job_config=job_config, failed=failed)
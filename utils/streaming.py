@@ -0,0 +1,51 @@
+# Streaming helpers for Gemini responses
+#
+# stream_text() yields a response chunk by chunk so the page can hand it to
+# st.write_stream() and show tokens as they arrive. track_first_token() wraps
+# any chunk iterator and records the time to first token per stage.
+
+import threading
+import time
+
+from utils import metrics
+
+_lock = threading.Lock()
+_ttft = {}  # stage -> {"count", "total_ms", "max_ms", "last_ms"}
+
+
+def stream_text(model, prompt):
+    """Yield the text of `model.generate_content(prompt)` as it is generated."""
+    for chunk in model.generate_content(prompt, stream=True):
+        text = chunk.text
+        if text:
+            yield text
+
+
+def track_first_token(chunks, stage):
+    """Pass `chunks` through unchanged, recording how long the first one took."""
+    started = time.perf_counter()
+    first = True
+    for chunk in chunks:
+        if first:
+            record_time_to_first_token(stage, (time.perf_counter() - started) * 1000)
+            first = False
+        yield chunk
+
+
+def record_time_to_first_token(stage, elapsed_ms):
+    metrics.observe(f"first_token:{stage}", elapsed_ms / 1000)
+    with _lock:
+        entry = _ttft.setdefault(stage, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0})
+        entry["count"] += 1
+        entry["total_ms"] += elapsed_ms
+        entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+        entry["last_ms"] = elapsed_ms
+
+
+def time_to_first_token_stats():
+    """Per-stage count / average / max / last time to first token in milliseconds."""
+    with _lock:
+        return {
+            stage: dict(entry, avg_ms=entry["total_ms"] / entry["count"])
+            for stage, entry in _ttft.items()
+        }
@@ -0,0 +1,179 @@
+# Chat turns that run outside the Streamlit script
+#
+# Any widget click reruns the page script from the top, so a turn computed
+# inside the script (route -> SQL -> BigQuery -> answer -> chart) is either
+# abandoned half-way or started again. Here a turn is an async function run on
+# one background asyncio loop and identified by a job id that the page keeps
+# in session_state. The blocking Gemini / BigQuery calls go to the shared
+# agent_pipeline pool. The turn records what it produces as a list of events;
+# on every rerun the page draws the events received so far and polls again
+# until the turn is finished. Submitting the same (session, input) key while
+# that turn is still running returns the running turn instead of a second one.
+# Stages take a timeout, and a turn still running after TURN_TIMEOUT_SECONDS
+# is cancelled and fails, so the page always gets its chat input back.
+
+import asyncio
+import os
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from utils import metrics
+from utils.agent_pipeline import submit
+
+POLL_INTERVAL_SECONDS = float(os.environ.get("TURN_POLL_INTERVAL_SECONDS", 0.5))
+TURN_TTL_SECONDS = int(os.environ.get("TURN_TTL_SECONDS", 15 * 60))
+TURN_TIMEOUT_SECONDS = int(os.environ.get("TURN_TIMEOUT_SECONDS", 5 * 60))
+
+# kind is "chunk" (part of a streamed text), "result" or "error"
+TurnEvent = namedtuple("TurnEvent", ["stage", "kind", "value", "elapsed"])
+
+_DONE = object()
+
+
+class Turn:
+    def __init__(self, key):
+        self.job_id = uuid.uuid4().hex
+        self.key = key
+        self.started = time.monotonic()
+        self.finished_at = None
+        self.status = "running"   # "running", "done" or "failed"
+        self._events = []
+        self._lock = threading.Lock()
+
+    @property
+    def done(self):
+        return self.status != "running"
+
+    def emit(self, stage, value, kind="result"):
+        with self._lock:
+            self._events.append(TurnEvent(stage, kind, value, time.monotonic() - self.started))
+
+    def events(self, start=0):
+        with self._lock:
+            return self._events[start:]
+
+    def result(self, stage):
+        """Latest "result" value of `stage`, or None."""
+        for event in reversed(self.events()):
+            if event.stage == stage and event.kind == "result":
+                return event.value
+        return None
+
+    def text(self, stage):
+        """Everything streamed so far for `stage`."""
+        return "".join(e.value for e in self.events() if e.stage == stage and e.kind == "chunk")
+
+    def errors(self):
+        return [e for e in self.events() if e.kind == "error"]
+
+    async def run(self, stage, func, *args, timeout=None):
+        """Await `func(*args)` on the stage pool and record its result (or error)."""
+        try:
+            with metrics.span(stage):
+                value = await asyncio.wait_for(asyncio.wrap_future(submit(func, *args)), timeout)
+        except asyncio.TimeoutError:
+            self.emit(stage, f"{stage} timed out after {timeout} seconds", kind="error")
+            raise
+        except Exception as e:
+            self.emit(stage, str(e), kind="error")
+            raise
+        self.emit(stage, value)
+        return value
+
+    async def stream(self, stage, chunks, timeout=None):
+        """Drain a blocking chunk iterator on the stage pool, recording each chunk;
+        returns the joined text. `timeout` covers the whole stream; the chunks
+        received before it ran out stay recorded."""
+        iterator = iter(chunks)
+        parts = []
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with metrics.span(stage):
+            while True:
+                remaining = None if deadline is None else max(0, deadline - time.monotonic())
+                try:
+                    chunk = await asyncio.wait_for(asyncio.wrap_future(submit(next, iterator, _DONE)), remaining)
+                except asyncio.TimeoutError:
+                    self.emit(stage, f"{stage} timed out after {timeout} seconds", kind="error")
+                    raise
+                except Exception as e:
+                    self.emit(stage, str(e), kind="error")
+                    raise
+                if chunk is _DONE:
+                    break
+                parts.append(chunk)
+                self.emit(stage, chunk, kind="chunk")
+        text = "".join(parts)
+        self.emit(stage, text)
+        return text
+
+
+class TurnEngine:
+    def __init__(self, ttl_seconds=TURN_TTL_SECONDS, timeout_seconds=TURN_TIMEOUT_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.timeout_seconds = timeout_seconds
+        self._turns = {}       # job_id -> Turn
+        self._running = {}     # key -> Turn, while it runs
+        self._lock = threading.Lock()
+        self._loop = None
+
+    def _ensure_loop(self):
+        # Caller holds self._lock
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            threading.Thread(target=self._loop.run_forever, name="turn-engine", daemon=True).start()
+        return self._loop
+
+    def submit(self, key, turn_func):
+        """Start `turn_func(turn)` (an async function) in the background and
+        return its Turn; a turn already running under `key` is returned as is."""
+        with self._lock:
+            self._expire()
+            running = self._running.get(key)
+            if running is not None:
+                return running
+            turn = Turn(key)
+            self._turns[turn.job_id] = turn
+            self._running[key] = turn
+            loop = self._ensure_loop()
+        asyncio.run_coroutine_threadsafe(self._drive(turn, turn_func), loop)
+        return turn
+
+    def get(self, job_id):
+        with self._lock:
+            return self._turns.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            return {"turns": len(self._turns), "running": len(self._running)}
+
+    async def _drive(self, turn, turn_func):
+        try:
+            with metrics.span("turn"):
+                await asyncio.wait_for(turn_func(turn), self.timeout_seconds)
+            turn.status = "done"
+        except asyncio.TimeoutError:
+            if time.monotonic() - turn.started >= self.timeout_seconds:
+                turn.emit("turn", f"did not finish within {self.timeout_seconds} seconds", kind="error")
+            turn.status = "failed"   # Otherwise a stage timed out and recorded its own error
+        except Exception as e:
+            if not turn.errors():
+                turn.emit("turn", str(e), kind="error")
+            turn.status = "failed"
+        finally:
+            turn.finished_at = time.monotonic()
+            with self._lock:
+                if self._running.get(turn.key) is turn:
+                    del self._running[turn.key]
+
+    def _expire(self):
+        # Caller holds self._lock; finished turns nobody picked up are dropped after the TTL
+        now = time.monotonic()
+        for job_id, turn in list(self._turns.items()):
+            if turn.finished_at is not None and now - turn.finished_at > self.ttl_seconds:
+                del self._turns[job_id]
+
+
+# One loop for the whole server process
+turn_engine = TurnEngine()